@@ -0,0 +1,208 @@
+"""
+Versioned JSON API over `Domain`, mounted at /api/v1. Writes must be sent
+as JSON, even without a body, errors are `{"error": message}` objects, and
+the session cookie of the HTML login authenticates API calls as well.
+"""
+from dataclasses import asdict
+from datetime import datetime
+from functools import wraps
+
+from flask import Blueprint, current_app, request, url_for
+from flask_user import current_user
+
+from domain import BASE_USER, SecurityException
+from utilities.util import BATCH_SCHEMA, THOUGHT_SCHEMA, validate_data
+
+api = Blueprint('api_v1', __name__, url_prefix='/api/v1')
+
+
+def domain():
+    return current_app.extensions['domain']
+
+
+def error(message, status):
+    return {"error": message}, status
+
+
+def failure(message):
+    """A domain error: 404 when the thought does not exist, else 500"""
+    return error(message, 404 if message == "Thought not found" else 500)
+
+
+@api.before_request
+def require_json_writes():
+    """
+    The session cookie authenticates API writes, so they must declare a JSON
+    body: a cross-site HTML form cannot send that content type without a
+    CORS preflight, which this API never grants.
+    """
+    if request.method not in ("GET", "HEAD", "OPTIONS") and not request.is_json:
+        return error("Expected an application/json request", 415)
+
+
+def login_required(view):
+    """Flask-User's decorators redirect to the login form; API clients get 401/403"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not current_user.is_authenticated:
+            return error("Authentication required", 401)
+        if not current_user.has_roles(BASE_USER):
+            return error("Not allowed", 403)
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def json_body(schema):
+    """Parse and validate the JSON request body, passed to the view as `body`"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not request.is_json:
+                return error("Expected an application/json body", 415)
+            body = request.get_json(silent=True)
+            if body is None:
+                return error("Malformed JSON body", 400)
+            s, errmsg = validate_data(body, schema)
+            if not s:
+                return error(errmsg, 400)
+            return view(*args, body=body, **kwargs)
+        return wrapper
+    return decorator
+
+
+def thought_json(row):
+    return {"id": row.id, "content": row.content, "creator": row.creator, "votes": row.votes}
+
+
+def viewer_rows(rows):
+    """Rows with `can_delete`/`can_vote` for the authenticated viewer"""
+    if not current_user.is_authenticated:
+        return rows
+    s, annotated = domain().annotate_permissions(current_user._get_current_object(), rows)
+    return annotated if s else rows
+
+
+@api.get('/thoughts')
+def list_thoughts():
+    after = request.args.get('after', type=int)
+    before = request.args.get('before', type=int)
+    size = request.args.get('size', type=int)
+    s, page = domain().get_thoughts_page(after=after, before=before, page_size=size)
+    if not s:
+        return error(page, 500)
+    return {
+        "items": viewer_rows(page.items),
+        "next_cursor": page.next_cursor,
+        "prev_cursor": page.prev_cursor,
+        "size": page.size,
+    }
+
+
+@api.get('/thoughts/top')
+def top_thoughts():
+    s, rows = domain().top_thoughts(request.args.get('n', type=int))
+    if not s:
+        return error(rows, 500)
+    return {"items": viewer_rows(rows)}
+
+
+@api.post('/thoughts')
+@login_required
+@json_body(THOUGHT_SCHEMA)
+def create_thought(body):
+    try:
+        s, thought = domain().create_thought_userid(content=body["content"], user=current_user)
+    except SecurityException as se:
+        return error(se.msg, 403)
+    if not s:
+        return error(thought, 500)
+    s, row = domain().get_thought_row(thought.id)
+    if not s:
+        return error(row, 500)
+    return thought_json(row), 201, {"Location": url_for('api_v1.get_thought', thought_id=row.id)}
+
+
+@api.get('/users/<int:user_id>/thoughts')
+def user_timeline(user_id):
+    """A user's thoughts, newest first: ?before=<cursor>&since=&until=<ISO 8601>&size="""
+    s, page = domain().get_user_timeline(user_id,
+                                         before=request.args.get('before', type=int),
+                                         since=request.args.get('since', type=datetime.fromisoformat),
+                                         until=request.args.get('until', type=datetime.fromisoformat),
+                                         page_size=request.args.get('size', type=int))
+    if not s:
+        return error(page, 500)
+    return {
+        "items": [
+            {"id": row.id, "content": row.content,
+             "created_at": row.created_at.isoformat() if row.created_at else None}
+            for row in page.items
+        ],
+        "next_cursor": page.next_cursor,
+        "size": page.size,
+    }
+
+
+@api.get('/thoughts/<int:thought_id>')
+def get_thought(thought_id):
+    s, row = domain().get_thought_row(thought_id)
+    if not s:
+        return failure(row)
+    return asdict(viewer_rows([row])[0])
+
+
+@api.patch('/thoughts/<int:thought_id>')
+@login_required
+@json_body(THOUGHT_SCHEMA)
+def update_thought(thought_id, body):
+    try:
+        s, errmsg = domain().update_thought(thought_id, body["content"], user=current_user)
+    except SecurityException as se:
+        return error(se.msg, 403)
+    if not s:
+        return failure(errmsg)
+    s, row = domain().get_thought_row(thought_id)
+    if not s:
+        return failure(row)
+    return thought_json(row)
+
+
+@api.delete('/thoughts/<int:thought_id>')
+@login_required
+def delete_thought(thought_id):
+    try:
+        s, errmsg = domain().delete_thought(thought_id, user=current_user)
+    except SecurityException as se:
+        return error(se.msg, 403)
+    if not s:
+        return failure(errmsg)
+    return "", 204
+
+
+@api.post('/thoughts/<int:thought_id>/votes')
+@login_required
+def vote_thought(thought_id):
+    try:
+        s, errmsg = domain().create_vote_user(thought_id=thought_id, user=current_user._get_current_object())
+    except SecurityException as se:
+        return error(se.msg, 403)
+    if not s:
+        return failure(errmsg)
+    s, votes = domain().get_vote_count(thought_id)
+    # With the vote queue on, the vote is accepted but may not be committed yet
+    return {"thought": thought_id, "votes": votes if s else None}, 202 if domain().vote_queue else 201
+
+
+@api.post('/batch')
+@login_required
+@json_body(BATCH_SCHEMA)
+def batch(body):
+    """
+    Many votes and deletions in one transaction:
+    {"operations": [{"op": "vote", "thought": 1}, {"op": "delete", "thought": 2}]}
+    answers {"results": [{"ok": true}, {"ok": false, "error": "..."}]} in order.
+    """
+    s, results = domain().apply_batch(current_user._get_current_object(), body["operations"])
+    if not s:
+        return error(results, 500)
+    return {"results": results}
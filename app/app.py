@@ -1,69 +1,249 @@
 #  __init__ + routes
+import hashlib
+import hmac
+import os
 import secrets
+import tempfile
+from time import monotonic
+from datetime import datetime, timezone
 import logging
-from flask import Flask, redirect, render_template, request, url_for
-from flask_sqlalchemy import SQLAlchemy
+import click
+from flask import Blueprint, Flask, Response, abort, current_app, make_response, redirect, render_template, request, stream_template, url_for
 from flask_user import login_required, current_user, roles_required, user_registered
+from markupsafe import Markup
+from sqlalchemy import event
+from werkzeug.http import is_resource_modified
+from werkzeug.local import LocalProxy
 
 """
 Flask-User comes with pre-defined routes for registration (user.register),
 login (user.login), and logout (user.logout).
 """
 
-app = Flask(__name__)
+from config import Config
+from model import db
+from api import api
+from profiling import init_profiling
+from domain import Domain, BASE_USER, OTHER, EXPORT_FIELDS, SecurityException, thought_tag
+from utilities.bulk import FORMATS, detect_format, read_records, write_records
+from utilities.jsonprovider import FastJSONProvider
+from utilities.templating import init_templates
 
-# Generate a strong, cryptographically secure secret key for session cookies
+# The Domain of the application handling the current request or command,
+# created by create_app() and kept in app.extensions
+domain: Domain = LocalProxy(lambda: current_app.extensions['domain'])
+bp = Blueprint('main', __name__, cli_group=None)
 
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:////app/instance/test.db'
-app.config['USER_APP_NAME'] = "ThoughtSharing"
-app.config['USER_ENABLE_EMAIL'] = False
-app.config['USER_ENABLE_USERNAME'] = True
-app.config['USER_REQUIRE_RETYPE_PASSWORD'] = False
-app.config['SECRET_KEY'] = secrets.token_urlsafe(32)
-app.config['USER_UNAUTHORIZED_ENDPOINT'] = 'error'
 
-# Configure logging for debugging
-logging.basicConfig(level=logging.DEBUG)
-app.logger.setLevel(logging.DEBUG)
+def create_app(config=None):
+    """
+    Application factory, used by `flask --app app run` and by wsgi.py
 
-db = SQLAlchemy(app)
-# Import models after db is initialized
-from domain import Domain, BASE_USER, OTHER, SecurityException
-domain = Domain(app=app, db=db)
+    Args:
+        config: Optional settings object or dict overriding `config.Config`
+    """
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+    app.config.from_object(Config)
+    if isinstance(config, dict):
+        app.config.update(config)
+    elif config is not None:
+        app.config.from_object(config)
+    if not app.config.get('SECRET_KEY'):
+        app.config['SECRET_KEY'] = shared_secret_key(app.instance_path)
 
+    # Debug mode only makes the app's own logger verbose: a DEBUG root logger
+    # buries it under every library's chatter. Per-request costs are in the
+    # Server-Timing header and the slow query log instead
+    logging.basicConfig(level=app.config['LOG_LEVEL'])
+    app.logger.setLevel(logging.DEBUG if app.debug else app.config['LOG_LEVEL'])
 
-@app.route('/')
+    db.init_app(app)
+    with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            pragmas = app.config['SQLITE_PRAGMAS']
+            event.listen(db.engine, 'connect', lambda conn, record: apply_sqlite_pragmas(conn, pragmas))
+        init_profiling(app, db.engine)
+    app_domain = Domain(app, db=db)
+    init_templates(app, app_domain.feed_cache)
+    app.add_template_global(thought_tag)
+    app.register_blueprint(bp)
+    app.register_blueprint(api)
+    return app
+
+
+def shared_secret_key(instance_path):
+    """
+    Read the session signing key from the instance folder, creating it on first
+    use. The key is written to a temporary file that is then linked into place,
+    which fails if another worker got there first: the file only ever appears
+    with its content, and concurrently starting workers agree on a single key.
+    """
+    os.makedirs(instance_path, exist_ok=True)
+    path = os.path.join(instance_path, 'secret_key')
+    if not os.path.exists(path):
+        fd, temp_path = tempfile.mkstemp(prefix='secret_key.', dir=instance_path)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as key_file:
+                key_file.write(secrets.token_urlsafe(32))
+                key_file.flush()
+                os.fsync(key_file.fileno())
+            try:
+                os.link(temp_path, path)
+            except FileExistsError:
+                pass
+        finally:
+            os.unlink(temp_path)
+    with open(path, encoding='utf-8') as key_file:
+        key = key_file.read().strip()
+    if not key:
+        raise RuntimeError(f"{path} is empty: delete it or set SECRET_KEY")
+    return key
+
+
+def apply_sqlite_pragmas(dbapi_connection, pragmas):
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+@bp.route('/')
 def index():
-    s, rs = domain.get_all_thoughts()
+    after = request.args.get('after', type=int)
+    before = request.args.get('before', type=int)
+    size = request.args.get('size', type=int)
+    s, rs = domain.get_thoughts_page(after=after, before=before, page_size=size)
     if not s:
         return render_template('index.html', err=rs)
-    return render_template('index.html', table=rs)
+    viewer = current_user.id if current_user.is_authenticated else None
+    # The page only changes when one of its thoughts does, which recomputes it
+    etag = hashlib.sha1(f"{rs.key}|{viewer}|{rs.computed_at}".encode()).hexdigest()
+    # HTTP dates have whole seconds; the ETag wins when a client sends both
+    last_modified = datetime.fromtimestamp(int(rs.computed_at), timezone.utc)
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response = Response(status=304)
+    elif len(rs.items) >= current_app.config.get('FEED_STREAM_MIN_SIZE', 50):
+        # Long pages are streamed row by row, so the first byte does not wait
+        # for the last row; rows still come from the per-row fragment cache
+        response = Response(stream_template('index.html', table=annotated_rows(rs.items, viewer), page=rs))
+    else:
+        response = make_response(render_template('index.html', rows=feed_rows(rs, viewer), page=rs))
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    # Pages differ per user: let browsers keep them, but revalidate every time
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+def feed_rows(page, viewer):
+    """Rendered table rows of a feed page, cached per page and viewer"""
+    key = f"rows:{page.key}:{viewer}"
+    cached = domain.feed_cache.get(key)
+    if cached is not None:
+        return Markup(cached[0])
+    html = render_template('_thought_rows.html', table=annotated_rows(page.items, viewer))
+    if page.versions is not None:
+        domain.feed_cache.set_derived(key, html, page.versions)
+    return Markup(html)
+
+@bp.get('/search')
+def search():
+    query = request.args.get('q', '')
+    cursor = request.args.get('cursor')
+    size = request.args.get('size', type=int)
+    s, rs = domain.search_thoughts(query, cursor=cursor, page_size=size)
+    if not s:
+        return render_template('search.html', query=query, table=[], err=rs)
+    viewer = current_user.id if current_user.is_authenticated else None
+    return render_template('search.html', query=query, table=annotated_rows(rs.items, viewer), page=rs)
+
+@bp.get('/top')
+def top_thoughts():
+    s, rs = domain.top_thoughts(request.args.get('n', type=int))
+    if not s:
+        return render_template('top.html', table=[], err=rs)
+    viewer = current_user.id if current_user.is_authenticated else None
+    return render_template('top.html', table=annotated_rows(rs, viewer))
+
+@bp.get('/events')
+def events():
+    """Server-Sent Events of feed changes: thought, edit, delete, votes and reset"""
+    subscription = domain.events.subscribe()
+    if subscription is None:
+        return Response("Too many live listeners", status=503, headers={'Retry-After': '60'})
+    dumps = current_app.json.dumps
+    heartbeat = current_app.config.get('EVENTS_HEARTBEAT', 15.0)
+    lifetime = current_app.config.get('EVENTS_STREAM_SECONDS', 120.0)
+
+    def stream():
+        deadline = monotonic() + lifetime
+        yield "retry: 3000\n\n"
+        while monotonic() < deadline:
+            changes = subscription.wait(min(heartbeat, max(deadline - monotonic(), 0)))
+            if not changes:
+                yield ": keep-alive\n\n"
+            for change in changes:
+                yield f"event: {change['type']}\ndata: {dumps(change)}\n\n"
+
+    response = Response(stream(), mimetype='text/event-stream')
+    # Also runs when the client disconnects before the stream starts
+    response.call_on_close(subscription.close)
+    response.cache_control.no_cache = True
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def annotated_rows(rows, viewer):
+    if viewer is None:
+        return rows
+    # Without permissions the rows simply render without action buttons
+    s, annotated = domain.annotate_permissions(current_user._get_current_object(), rows)
+    return annotated if s else rows
 
 # Here we allow unauthenticated users to access the index page.
-@app.get('/index')
+@bp.get('/index')
 def home_page():
     return render_template('home_page.html')
 
-@app.get('/error')
+@bp.get('/metrics')
+def metrics():
+    """Authorization counters for a scraper holding METRICS_TOKEN (Authorization: Bearer ...)"""
+    token = current_app.config.get('METRICS_TOKEN')
+    if not token:
+        abort(404)
+    sent = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    if not hmac.compare_digest(sent.encode(), token.encode()):
+        return Response('Unauthorized\n', status=401, mimetype='text/plain',
+                        headers={'WWW-Authenticate': 'Bearer'})
+    return Response(domain.cedar.metrics_text(), mimetype='text/plain; version=0.0.4')
+
+@bp.get('/error')
 def error():
     msg = request.args.get('msg') if hasattr(request.args, "msg") else "You are not authorized to access this page"
     return render_template('error.html', message=msg)
 
-@user_registered.connect_via(app)
+@user_registered.connect
 def _user_registers_assign_roles_hok(sender, user, **kwargs):
     s, rs = domain.get_role_by_name(role_name=BASE_USER)
     if not s:
-        return redirect(url_for('error'))
+        return redirect(url_for('main.error'))
     s, rs = domain.add_role_to_user(user=user, role=rs)
     if not s:
-        return redirect(url_for('error'))
+        return redirect(url_for('main.error'))
 
-@app.get('/memberpage')
+@bp.get('/memberpage')
 @login_required
 def member_page():
-    return render_template('member_page.html', username=current_user.username)
+    s, rs = domain.get_user_timeline(current_user.id,
+                                     before=request.args.get('before', type=int),
+                                     since=request.args.get('since', type=datetime.fromisoformat),
+                                     until=request.args.get('until', type=datetime.fromisoformat),
+                                     page_size=request.args.get('size', type=int))
+    if not s:
+        return render_template('member_page.html', username=current_user.username, err=rs)
+    return render_template('member_page.html', username=current_user.username, timeline=rs)
 
-@app.route('/add_thought', methods=['POST'])
+@bp.route('/add_thought', methods=['POST'])
 @login_required
 @roles_required(BASE_USER)
 def add_thought():
@@ -73,11 +253,11 @@ def add_thought():
         s, errmsg = domain.create_thought_userid(content=cnt, user=current_user)
     except SecurityException as se:
         # TODO implement error handling
-        return redirect(url_for('error', msg=se.msg))
-    return redirect(url_for('index'))
+        return redirect(url_for('main.error', msg=se.msg))
+    return redirect(url_for('main.index'))
 
 
-@app.route('/delete_thought')
+@bp.route('/delete_thought')
 @login_required
 @roles_required(BASE_USER)
 # TODO verify form data schema
@@ -86,25 +266,122 @@ def delete_thought():
     try:
         s, errmsg = domain.delete_thought(tid, user=current_user)
     except SecurityException as se:
-        return redirect(url_for('error', msg=se.msg))
+        return redirect(url_for('main.error', msg=se.msg))
     if not s:
-        return redirect(url_for('error'))
-    return redirect(url_for('index'))
+        return redirect(url_for('main.error'))
+    return redirect(url_for('main.index'))
 
-@app.route('/vote_thought')
+@bp.route('/vote_thought')
 @login_required
 @roles_required(BASE_USER)
 # TODO sanitize id
 def vote_thought():
     tid = request.args['id']
     try:
-        s, errmsg = domain.create_vote_username(thought_id=tid, username=current_user.username)
+        s, errmsg = domain.create_vote_user(thought_id=tid, user=current_user._get_current_object())
         if not s:
-            return redirect(url_for('error', msg=errmsg))
-        return redirect(url_for('index'))
+            return redirect(url_for('main.error', msg=errmsg))
+        return redirect(url_for('main.index'))
     
     except Exception as e:
-        return redirect(url_for('error', msg=str(e)))
+        return redirect(url_for('main.error', msg=str(e)))
+
+@bp.cli.command('init-db')
+def init_db_command():
+    """Create the tables, seed the roles and validate the Cedar policies."""
+    s, errmsg = domain.initialise_database()
+    if not s:
+        raise click.ClickException(errmsg)
+    check_policies_command.callback()
+    click.echo("Database initialised")
+
+@bp.cli.command('check-policies')
+def check_policies_command():
+    """Parse and validate the Cedar policy set and schema."""
+    try:
+        domain.initialise_cedar(current_app.config)
+    except (OSError, ValueError) as e:
+        raise click.ClickException(str(e))
+    click.echo("Cedar policies are valid")
+
+@bp.cli.command('check-top-thoughts')
+@click.option('-n', 'size', type=int, default=None, help='How many places to compare.')
+def check_top_thoughts_command(size):
+    """Compare the in-memory top thoughts with a ranking counted in SQL."""
+    s, rs = domain.top_thoughts(size)
+    if not s:
+        raise click.ClickException(rs)
+    ranked = [(row.id, row.votes) for row in rs]
+    expected = [tuple(row) for row in domain.rank_thoughts_sql(len(ranked) or 1)][:len(ranked)]
+    for place, (got, want) in enumerate(zip(ranked, expected), 1):
+        if got != want:
+            raise click.ClickException(f"Place {place}: thought {got[0]} with {got[1]} votes, "
+                                       f"SQL ranks thought {want[0]} with {want[1]} votes")
+    click.echo(f"Top {len(ranked)} thoughts match the SQL ranking")
+
+@bp.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """Create the full-text index on older databases and reindex every thought."""
+    s, errmsg = domain.rebuild_search_index()
+    if not s:
+        raise click.ClickException(errmsg)
+    click.echo("Search index rebuilt")
+
+@bp.cli.command('import-data')
+@click.argument('kind', type=click.Choice(list(EXPORT_FIELDS)))
+@click.argument('source', type=click.File('r', encoding='utf-8'))
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), help="Default: from the file extension, else jsonl.")
+@click.option('--chunk-size', type=int, help="Rows per transaction, default BULK_CHUNK_SIZE.")
+@click.option('--hash-passwords', is_flag=True, help="Users only: passwords are plain text, hash them.")
+def import_data_command(kind, source, fmt, chunk_size, hash_passwords):
+    """Stream users, thoughts or votes from a JSONL or CSV file ('-' for stdin)."""
+    records = read_records(source, detect_format(source.name, fmt))
+    if kind == 'users':
+        s, rs = domain.import_users(records, chunk_size=chunk_size, hash_passwords=hash_passwords)
+    elif kind == 'thoughts':
+        s, rs = domain.import_thoughts(records, chunk_size=chunk_size)
+    else:
+        s, rs = domain.import_votes(records, chunk_size=chunk_size)
+    if not s:
+        raise click.ClickException(rs)
+    click.echo(f"Imported {rs['inserted']} {kind}, skipped {rs['skipped']}", err=True)
+
+@bp.cli.command('export-data')
+@click.argument('kind', type=click.Choice(list(EXPORT_FIELDS)))
+@click.argument('target', type=click.File('w', encoding='utf-8'))
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), help="Default: from the file extension, else jsonl.")
+def export_data_command(kind, target, fmt):
+    """Stream users, thoughts or votes to a JSONL or CSV file ('-' for stdout)."""
+    s, rs = domain.export_records(kind)
+    if not s:
+        raise click.ClickException(rs)
+    fields, records = rs
+    count = write_records(target, detect_format(target.name, fmt), fields, records)
+    click.echo(f"Exported {count} {kind}", err=True)
+
+@bp.cli.command('rebuild-user-roles')
+def rebuild_user_roles_command():
+    """Let a role be held by several users on databases created before that was possible."""
+    s, errmsg = domain.rebuild_user_roles()
+    if not s:
+        raise click.ClickException(errmsg)
+    click.echo("User roles table rebuilt")
+
+@bp.cli.command('rebuild-vote-counters')
+def rebuild_vote_counters_command():
+    """Add missing vote counter columns and recompute them from the votes table."""
+    s, errmsg = domain.rebuild_vote_counters()
+    if not s:
+        raise click.ClickException(errmsg)
+    click.echo("Vote counters rebuilt")
+
+@bp.cli.command('rebuild-timeline-index')
+def rebuild_timeline_index_command():
+    """Add thoughts.created_at and the per-user timeline index."""
+    s, errmsg = domain.rebuild_timeline_index()
+    if not s:
+        raise click.ClickException(errmsg)
+    click.echo("Timeline index rebuilt")
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    create_app().run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,65 @@
+"""
+Microbenchmark: cost of one Cedar decision when policies and schema are sent
+as text on every call, against the CedarClient path that validated them once.
+
+Run from the app directory:
+    python -m bench.cedar_decisions [iterations]
+"""
+import sys
+from time import perf_counter
+
+import cedarpy
+
+from cedar.authz import CedarClient, EntitySerializer
+from domain import POLICY_PATH, SCHEMA_PATH
+
+ENTITIES = [
+    {"uid": {"type": "User", "id": "1"}, "attrs": {"username": "alice"},
+     "parents": [{"type": "Role", "id": "baseuser"}]},
+    {"uid": {"type": "User", "id": "2"}, "attrs": {"username": "bob"},
+     "parents": [{"type": "Role", "id": "baseuser"}]},
+    {"uid": {"type": "Thought", "id": "7"},
+     "attrs": {"creator": {"__entity": {"type": "User", "id": "2"}}}, "parents": []},
+]
+REQUEST = {
+    "principal": 'User::"1"',
+    "action": 'Action::"voteThought"',
+    "resource": 'Thought::"7"',
+    "context": {"personalVoteCount": 1},
+}
+
+
+def timed(fn, iterations):
+    fn()
+    start = perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (perf_counter() - start) / iterations * 1e6
+
+
+def main(iterations=2000):
+    with open(POLICY_PATH, encoding="utf-8") as f:
+        policies = f.read()
+    with open(SCHEMA_PATH, encoding="utf-8") as f:
+        schema = f.read()
+    client = CedarClient(policies, EntitySerializer(), schema, cache_size=0)
+
+    def per_call_text():
+        return cedarpy.is_authorized(REQUEST, policies, ENTITIES, schema)
+
+    def preparsed():
+        return client.is_authorized(
+            REQUEST["principal"], REQUEST["action"], REQUEST["resource"],
+            REQUEST["context"], ENTITIES,
+        )
+
+    assert per_call_text().decision == preparsed().decision
+    before = timed(per_call_text, iterations)
+    after = timed(preparsed, iterations)
+    print(f"policy+schema text per call: {before:8.1f} us/decision")
+    print(f"validated once (CedarClient): {after:8.1f} us/decision")
+    print(f"speedup: {before / after:.2f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,351 @@
+"""
+Load benchmark: throughput and p50/p95/p99 latency of login, `/`,
+`/add_thought`, `/vote_thought` and `/delete_thought`.
+
+A throwaway database is seeded through Domain's bulk import, then every
+scenario runs with one logged-in user per concurrent worker, either in
+process through the Flask test client or over HTTP against gunicorn
+(started here with gunicorn.conf.py, or any server given with --url that
+uses the same database). Results are written as JSON; --compare fails
+when a scenario got slower than a previous run.
+
+Run from the app directory:
+    python -m bench.load --mode client --output before.json
+    python -m bench.load --mode http --workers 4 --compare before.json
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from time import perf_counter
+from urllib.parse import urlencode, urlsplit
+
+PASSWORD = "Password1"
+SCENARIOS = ["login", "index", "add_thought", "vote_thought", "delete_thought"]
+CSRF = re.compile(r'name="csrf_token"[^>]*value="([^"]+)"')
+
+
+def username(i):
+    return f"bench{i:06d}"
+
+
+def seed(uri, users, thoughts, votes_per_thought, deletable, owners):
+    """
+    Users bench000000..., thoughts 1..`thoughts` round-robin over them with
+    `votes_per_thought` votes each, then `deletable` thoughts round-robin over
+    the first `owners` users, the workers, for the delete scenario.
+    """
+    from app import create_app
+
+    app = create_app({"SQLALCHEMY_DATABASE_URI": uri, "LOG_LEVEL": "WARNING"})
+    domain = app.extensions['domain']
+    with app.app_context():
+        checks = [domain.initialise_database()]
+        # One hash for everybody: hashing per user would dominate seeding
+        password = domain.user_manager.password_manager.hash_password(PASSWORD)
+        checks.append(domain.import_users({"username": username(i), "password": password}
+                                          for i in range(users)))
+        checks.append(domain.import_thoughts(
+            {"id": t, "username": username((t - 1) % users if t <= thoughts else (t - 1) % owners),
+             "content": f"benchmark thought {t}"}
+            for t in range(1, thoughts + deletable + 1)))
+        checks.append(domain.import_votes(
+            {"username": username((t + k) % users), "thought": t}
+            for t in range(1, thoughts + 1) for k in range(votes_per_thought)))
+    for s, rs in checks:
+        if not s:
+            raise SystemExit(f"seeding failed: {rs}")
+    return app
+
+
+class ClientSession:
+    """Test client adapter: (status, location, body) per request"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, form=None):
+        response = self.client.open(path, method=method, data=form)
+        return response.status_code, response.headers.get("Location"), response.get_data(as_text=True)
+
+    def close(self):
+        pass
+
+
+class HTTPSession:
+    """Keep-alive HTTP connection with its own cookie jar, redirects not followed"""
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+        self.cookies = {}
+
+    def request(self, method, path, form=None):
+        headers = {"Cookie": "; ".join(f"{k}={v}" for k, v in self.cookies.items())}
+        body = None
+        if form is not None:
+            body = urlencode(form)
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        self.connection.request(method, path, body=body, headers=headers)
+        response = self.connection.getresponse()
+        data = response.read().decode("utf-8", "replace")
+        for header in response.headers.get_all("Set-Cookie") or []:
+            name, _, value = header.split(";", 1)[0].partition("=")
+            self.cookies[name.strip()] = value
+        return response.status, response.headers.get("Location"), data
+
+    def close(self):
+        self.connection.close()
+
+
+class Worker:
+    """
+    One benchmark user: logs in once, then runs its share of every scenario.
+    The login scenario signs in on fresh sessions, as a logged-in session
+    is redirected by Flask-User without checking the password.
+    """
+
+    def __init__(self, index, new_session, users, thoughts, deletable_ids, seed_value):
+        self.index = index
+        self.new_session = new_session
+        self.session = new_session()
+        self.users = users
+        self.thoughts = thoughts
+        self.deletable_ids = deletable_ids
+        self.random = random.Random(seed_value)
+        self.logins = []
+
+    def login_form(self, session):
+        _, _, page = session.request("GET", "/user/sign-in")
+        match = CSRF.search(page)
+        return {"username": username(self.index), "password": PASSWORD,
+                "csrf_token": match.group(1) if match else ""}
+
+    def prepare(self, scenario, n):
+        """Untimed set-up: anonymous sessions holding a sign-in form for the login scenario"""
+        if scenario == "login":
+            self.logins = []
+            for _ in range(n):
+                session = self.new_session()
+                self.logins.append((session, self.login_form(session)))
+
+    def verify(self, scenario):
+        """Untimed check that every login really authenticated its session; returns the failures"""
+        errors = 0
+        if scenario == "login":
+            for session, _ in self.logins:
+                status, _, _ = session.request("GET", "/memberpage")
+                errors += status != 200
+                session.close()
+            self.logins = []
+        return errors
+
+    def run(self, scenario, n):
+        """Latencies in seconds and the number of unexpected responses"""
+        latencies, errors = [], 0
+        form = None
+        for i in range(n):
+            method, path, expected = "GET", "/", (200,)
+            session = self.session
+            if scenario == "login":
+                # Flask-User answers a fresh login with an empty Location
+                session, form = self.logins[i]
+                method, path, expected = "POST", "/user/sign-in", ("", "/")
+            elif scenario == "add_thought":
+                form = {"thought": f"added by {username(self.index)} #{i}"}
+                method, path, expected = "POST", "/add_thought", ("/",)
+            elif scenario == "vote_thought":
+                # Any seeded thought this user did not write; denials past the
+                # vote limit are valid responses, so both redirects count
+                thought = self.random.randrange(1, self.thoughts + 1)
+                if (thought - 1) % self.users == self.index:
+                    thought = thought % self.thoughts + 1
+                path, expected = f"/vote_thought?id={thought}", ("/", "/error")
+            elif scenario == "delete_thought":
+                if i >= len(self.deletable_ids):
+                    break
+                path, expected = f"/delete_thought?id={self.deletable_ids[i]}", ("/",)
+            started = perf_counter()
+            status, location, _ = session.request(method, path, form if method == "POST" else None)
+            latencies.append(perf_counter() - started)
+            outcome = status if location is None else urlsplit(location).path
+            if outcome not in expected:
+                errors += 1
+        return latencies, errors
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * p / 100
+    low, high = int(k), min(int(k) + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (k - low)
+
+
+def run_scenario(workers, scenario, requests):
+    share = [requests // len(workers) + (1 if i < requests % len(workers) else 0) for i in range(len(workers))]
+    results = [None] * len(workers)
+    for worker, n in zip(workers, share):
+        worker.prepare(scenario, n)
+
+    def target(i):
+        results[i] = workers[i].run(scenario, share[i])
+
+    threads = [threading.Thread(target=target, args=(i,)) for i in range(len(workers))]
+    started = perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = perf_counter() - started
+    failed = sum(worker.verify(scenario) for worker in workers)
+    latencies = sorted(l for result in results for l in result[0])
+    return {
+        "requests": len(latencies),
+        "errors": sum(result[1] for result in results) + failed,
+        "seconds": round(elapsed, 4),
+        "throughput": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3) if latencies else 0.0,
+        **{f"p{p}_ms": round(percentile(latencies, p) * 1000, 3) for p in (50, 95, 99)},
+    }
+
+
+def start_server(app_dir, uri, port, workers, threads):
+    env = dict(os.environ, DATABASE_URL=uri, GUNICORN_BIND=f"127.0.0.1:{port}",
+               GUNICORN_WORKERS=str(workers), GUNICORN_THREADS=str(threads),
+               GUNICORN_ACCESS_LOG="/dev/null", GUNICORN_LOG_LEVEL="warning",
+               SECRET_KEY=os.environ.get("SECRET_KEY", "bench-" + "x" * 32))
+    server = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "wsgi:app"],
+                              cwd=app_dir, env=env)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            connection.request("GET", "/index")
+            connection.getresponse().read()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise SystemExit("gunicorn did not start")
+
+
+def git_revision(app_dir):
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=app_dir,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, mode, baseline_path, tolerance):
+    """Print the change of every p95 and throughput; True when nothing regressed"""
+    with open(baseline_path, encoding="utf-8") as f:
+        previous = json.load(f)
+    if previous.get("mode") != mode:
+        print(f"warning: comparing a {mode} run against a {previous.get('mode')} run")
+    baseline = previous["scenarios"]
+    ok = True
+    for name, current in results.items():
+        before = baseline.get(name)
+        if not before or not before["p95_ms"] or not before["throughput"]:
+            continue
+        p95 = current["p95_ms"] / before["p95_ms"] - 1
+        throughput = current["throughput"] / before["throughput"] - 1
+        regressed = p95 > tolerance or throughput < -tolerance
+        ok = ok and not regressed
+        print(f"{name:>15}: p95 {p95:+7.1%}  throughput {throughput:+7.1%}{'  REGRESSION' if regressed else ''}")
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--mode", choices=["client", "http"], default="client")
+    parser.add_argument("--url", help="http mode: benchmark this server instead of starting gunicorn")
+    parser.add_argument("--database", help="SQLite file to seed (default: a temporary one)")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--thoughts", type=int, default=5000)
+    parser.add_argument("--votes-per-thought", type=int, default=2)
+    parser.add_argument("--requests", type=int, default=500, help="per scenario")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers")
+    parser.add_argument("--threads", type=int, default=4, help="gunicorn threads per worker")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="previous results JSON to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed relative p95/throughput change before --compare fails")
+    args = parser.parse_args(argv)
+    scenarios = [s for s in args.scenarios.split(",") if s]
+    if set(scenarios) - set(SCENARIOS):
+        parser.error(f"unknown scenarios: {sorted(set(scenarios) - set(SCENARIOS))}")
+    if args.concurrency > args.users or args.votes_per_thought >= args.users:
+        parser.error("--users must exceed --concurrency and --votes-per-thought")
+
+    app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with tempfile.TemporaryDirectory() as tmp:
+        uri = "sqlite:///" + os.path.abspath(args.database or os.path.join(tmp, "bench.db"))
+        deletable = args.requests
+        started = perf_counter()
+        app = seed(uri, args.users, args.thoughts, args.votes_per_thought, deletable, args.concurrency)
+        seeding = perf_counter() - started
+        first_deletable = args.thoughts + 1
+
+        server = None
+        if args.mode == "http" and not args.url:
+            server = start_server(app_dir, uri, args.port, args.workers, args.threads)
+        url = args.url or f"http://127.0.0.1:{args.port}"
+        try:
+            workers = []
+            for w in range(args.concurrency):
+                new_session = (lambda: ClientSession(app)) if args.mode == "client" else (lambda: HTTPSession(url))
+                owned = [t for t in range(first_deletable, first_deletable + deletable)
+                         if (t - 1) % args.concurrency == w]
+                workers.append(Worker(w, new_session, args.users, args.thoughts, owned, args.seed + w))
+            for worker in workers:
+                status, location, _ = worker.session.request("POST", "/user/sign-in",
+                                                             worker.login_form(worker.session))
+                if location is None or urlsplit(location).path not in ("", "/"):
+                    raise SystemExit(f"cannot log in as {username(worker.index)}: {status} {location}")
+            results = {}
+            for scenario in scenarios:
+                results[scenario] = run_scenario(workers, scenario, args.requests)
+                r = results[scenario]
+                print(f"{scenario:>15}: {r['throughput']:8.1f} req/s  p50 {r['p50_ms']:7.2f} ms  "
+                      f"p95 {r['p95_ms']:7.2f} ms  p99 {r['p99_ms']:7.2f} ms  errors {r['errors']}")
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(10)
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "revision": git_revision(app_dir),
+        "python": platform.python_version(),
+        "mode": args.mode,
+        "parameters": {k: getattr(args, k) for k in
+                       ("users", "thoughts", "votes_per_thought", "requests", "concurrency", "workers", "threads")},
+        "seeding_seconds": round(seeding, 3),
+        "scenarios": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.compare and not compare(results, args.mode, args.compare, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Benchmark: ranked FTS5 search against a `LIKE '%word%'` scan of thoughts.
+
+Builds a throwaway SQLite database with the production table, triggers and
+FTS5 index, so inserts pay the same trigger cost as the application.
+
+Run from the app directory:
+    python -m bench.search [rows] [repeats]
+"""
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+from time import perf_counter
+
+from model import THOUGHTS_FTS_DDL
+
+# The trailing "x" keeps LIKE substring matches equal to whole-word matches
+WORDS = [f"w{i:05d}x" for i in range(20000)]
+# A word in ~0.06% of rows, two such words together, and a word in none
+QUERIES = ["w00007x", "w00007x w00123x", "nosuchword"]
+LIMIT = 20
+
+
+def build(path, rows):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("CREATE TABLE thoughts (id INTEGER PRIMARY KEY, content VARCHAR(500) NOT NULL)")
+    for statement in THOUGHTS_FTS_DDL:
+        conn.execute(statement)
+    rng = random.Random(0)
+    start = perf_counter()
+    batch = 50000
+    for first in range(0, rows, batch):
+        conn.executemany(
+            "INSERT INTO thoughts (content) VALUES (?)",
+            ([" ".join(rng.choices(WORDS, k=12))] for _ in range(min(batch, rows - first))),
+        )
+        conn.commit()
+    print(f"loaded {rows} rows in {perf_counter() - start:.1f}s (triggers included)")
+    return conn
+
+
+def timed(conn, sql, params, repeats):
+    result = conn.execute(sql, params).fetchall()
+    start = perf_counter()
+    for _ in range(repeats):
+        conn.execute(sql, params).fetchall()
+    return (perf_counter() - start) / repeats * 1e3, len(result)
+
+
+def main(rows=1_000_000, repeats=5):
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = build(os.path.join(tmp, "search.db"), rows)
+        fts = ("SELECT thoughts.id, thoughts.content FROM thoughts_fts "
+               "JOIN thoughts ON thoughts.id = thoughts_fts.rowid "
+               "WHERE thoughts_fts MATCH ? ORDER BY thoughts_fts.rank, thoughts.id LIMIT ?")
+        like = ("SELECT id, content FROM thoughts "
+                "WHERE " + " AND ".join(["content LIKE ?"] * 2) + " ORDER BY id LIMIT ?")
+        for query in QUERIES:
+            words = query.split()
+            match = " ".join(f'"{w}"' for w in words)
+            patterns = [f"%{w}%" for w in (words * 2)[:2]]
+            fts_ms, fts_n = timed(conn, fts, (match, LIMIT), repeats)
+            like_ms, like_n = timed(conn, like, (*patterns, LIMIT), repeats)
+            print(f"{query!r:19} fts5: {fts_ms:8.2f} ms ({fts_n} rows)   "
+                  f"LIKE: {like_ms:8.2f} ms ({like_n} rows)")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,56 @@
+"""
+Startup benchmark: wall time from launching a fresh interpreter to the first
+response of `/`, split into module import, create_app() and first request.
+
+Run from the app directory:
+    python -m bench.startup [runs]
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from time import perf_counter
+
+CHILD = """
+import json, logging
+from time import perf_counter
+start = perf_counter()
+import app
+imported = perf_counter()
+application = app.create_app({'LOG_LEVEL': 'WARNING'})
+created = perf_counter()
+status = application.test_client().get('/').status_code
+served = perf_counter()
+print(json.dumps({
+    'status': status,
+    'import': imported - start,
+    'create_app': created - imported,
+    'first_request': served - created,
+}))
+"""
+
+
+def main(runs=10):
+    app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{tmp}/bench.db", SECRET_KEY="bench-" + "x" * 32)
+        subprocess.run([sys.executable, "-m", "flask", "--app", "app", "init-db"],
+                       cwd=app_dir, env=env, check=True, capture_output=True)
+        samples = []
+        for _ in range(runs):
+            started = perf_counter()
+            out = subprocess.run([sys.executable, "-c", CHILD], cwd=app_dir, env=env,
+                                 check=True, capture_output=True, text=True).stdout
+            sample = json.loads(out.strip().splitlines()[-1])
+            sample["total"] = perf_counter() - started
+            samples.append(sample)
+    for name in ("import", "create_app", "first_request", "total"):
+        values = [s[name] * 1000 for s in samples]
+        print(f"{name:>14}: median {statistics.median(values):7.1f} ms  min {min(values):7.1f} ms")
+    print(f"statuses: {sorted({s['status'] for s in samples})}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
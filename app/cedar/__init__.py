@@ -1,2 +1,6 @@
 # Cedar integration helpers for the Event Platform
-from .authz import CedarClient, EntitySerializer, SecurityException
+from .authz import CedarClient, EntitySerializer, EntityType, SecurityException
+from .audit import AuditLogWriter
+from .cache import DecisionCache
+from .metrics import AuthzMetrics
+from .store import EntityStore
@@ -0,0 +1,55 @@
+import json
+import logging
+from queue import Empty, Full, Queue
+from threading import Event, Thread
+
+logger = logging.getLogger(__name__)
+
+
+class AuditLogWriter:
+    """
+    Buffered JSON-lines writer for authorization decisions. Records are handed
+    to a background thread through a bounded queue; when it is full, records
+    are dropped and counted instead of blocking the request thread.
+    """
+
+    def __init__(self, path: str, maxsize: int = 10000, flush_interval: float = 1.0, batch_size: int = 500):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.dropped = 0
+        self._queue: Queue = Queue(maxsize=maxsize)
+        self._closed = Event()
+        self._thread = Thread(target=self._run, name="cedar-audit", daemon=True)
+        self._thread.start()
+
+    def submit(self, record: dict):
+        try:
+            self._queue.put_nowait(record)
+        except Full:
+            self.dropped += 1
+
+    def close(self, timeout: float = 5.0):
+        """Stop the writer after flushing everything already queued"""
+        self._closed.set()
+        self._thread.join(timeout)
+
+    def _run(self):
+        while not (self._closed.is_set() and self._queue.empty()):
+            batch = []
+            try:
+                batch.append(self._queue.get(timeout=self.flush_interval))
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get_nowait())
+            except Empty:
+                pass
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch: list[dict]):
+        try:
+            with open(self.path, "a", encoding="utf-8") as log:
+                log.writelines(json.dumps(record, default=str) + "\n" for record in batch)
+        except OSError as e:
+            self.dropped += len(batch)
+            logger.error("Cannot write authorization audit log %s: %s", self.path, e)
@@ -1,9 +1,45 @@
 from enum import Enum
+import hashlib
+import json
 import cedarpy
+from time import perf_counter, time
 from typing import Any, Callable, TypeAlias, TypeVar
 from dataclasses import asdict, is_dataclass
-from flask_sqlalchemy import SQLAlchemy
-from model import db
+from flask import g, has_request_context
+from .audit import AuditLogWriter
+from .cache import DecisionCache
+from .metrics import AuthzMetrics
+from .store import EntityStore
+
+DECISION_LABELS = {
+    cedarpy.Decision.Allow: "allow",
+    cedarpy.Decision.Deny: "deny",
+    cedarpy.Decision.NoDecision: "no_decision",
+}
+
+
+def uid_key(uid: dict[str, Any]) -> tuple[str, str]:
+    return (uid["type"], str(uid["id"]))
+
+
+def entity_references(value: Any):
+    """UIDs of the entities referenced in attribute or context values, or named in policy JSON"""
+    if isinstance(value, dict):
+        reference = value.get("__entity")
+        if isinstance(reference, dict):
+            yield uid_key(reference)
+            return
+        for key, item in value.items():
+            if key in ("entity", "entities"):
+                for uid in item if isinstance(item, list) else [item]:
+                    if isinstance(uid, dict) and "type" in uid and "id" in uid:
+                        yield uid_key(uid)
+            else:
+                yield from entity_references(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from entity_references(item)
+
 
 class SecurityException(Exception):
     """Exception raised when an action is not authorized by security policy"""
@@ -12,11 +48,75 @@ class SecurityException(Exception):
         self.msg = msg
 
 
+class EntityType:
+    """Precomputed extractors turning instances of one Python type into a Cedar entity"""
+
+    def __init__(
+        self,
+        cedar_type: str,
+        attributes: Callable[[Any], dict[str, Any]],
+        parents: Callable[[Any], list[Any]] | None = None,
+        identifier: Callable[[Any], Any] | None = None,
+    ):
+        self.cedar_type = cedar_type
+        self.attributes = attributes
+        self.parents = parents or (lambda subject: [])
+        self.identifier = identifier or (lambda subject: getattr(subject, "name", getattr(subject, "id", None)))
+
+
 class EntitySerializer:
     """Converts Python objects to Cedar entities for authorization"""
 
     def __init__(self):
-        pass
+        self.types: dict[type, EntityType] = {}
+        self.version = 0
+
+    def register(
+        self,
+        python_type: type,
+        cedar_type: str,
+        attributes: Callable[[Any], dict[str, Any]],
+        parents: Callable[[Any], list[Any]] | None = None,
+        identifier: Callable[[Any], Any] | None = None,
+    ):
+        """
+        Register how instances of `python_type` map to the Cedar `cedar_type`
+
+        Args:
+            python_type: Python class of the serialized objects
+            cedar_type: Cedar entity type name
+            attributes: Returns the entity attributes of an instance
+            parents: Returns the parent entities of an instance, as objects or UID dicts
+            identifier: Returns the entity id, defaults to `name` then `id`
+        """
+        self.types[python_type] = EntityType(cedar_type, attributes, parents, identifier)
+
+    def entity_type(self, subject: object) -> EntityType:
+        # `__class__` rather than type() so that proxies such as current_user resolve
+        cls = subject.__class__
+        entity_type = self.types.get(cls)
+        if entity_type is None:
+            for base in cls.__mro__[1:]:
+                if base in self.types:
+                    entity_type = self.types[cls] = self.types[base]
+                    break
+            else:
+                raise ValueError(f"No Cedar entity type registered for {cls.__name__}")
+        return entity_type
+
+    def invalidate(self):
+        """Bump the version so entities memoized in the current request are serialized again"""
+        self.version += 1
+
+    def entity_uid(self, subject: object) -> dict[str, str]:
+        """Cedar UID of an object as JSON, e.g. `{"type": "User", "id": "123"}`"""
+        if isinstance(subject, dict):
+            return subject
+        entity_type = self.entity_type(subject)
+        identifier = entity_type.identifier(subject)
+        if identifier is None:
+            raise ValueError(f"Cannot generate identifier for {subject}")
+        return {"type": entity_type.cedar_type, "id": str(identifier).strip()}
 
     def entity_reference(self, subject: object) -> str:
         """
@@ -25,24 +125,19 @@ class EntitySerializer:
         Format: `EntityType::"object_id"`
         Example: `User::"123"` or `Document::"456"`
         """
-        """
-        cedar entity types :
-        - User
-        - Role
-        - Thought
-        - Vote
-        """
-        identifier = getattr(subject, "name", getattr(subject, "id", None))
-        if identifier is None:
-            raise ValueError(f"Cannot generate identifier for {subject}")
+        uid = self.entity_uid(subject)
+        return f"{uid['type']}::\"{uid['id']}\""
 
-        return f"{subject.__class__.__name__}::\"{str(identifier).strip()}\""
+    def entity_reference_json(self, subject: object) -> dict[str, Any]:
+        """Attribute value referencing another entity"""
+        return {"__entity": self.entity_uid(subject)}
 
     def entity_json(self, subject: object) -> dict[str, Any]:
         """
         Convert object to full Cedar entity JSON for the entity store
 
-        Returns complete entity with UID, attributes, and parents
+        Returns complete entity with UID, attributes, and parents. Within a
+        request the result is memoized per entity and serializer version.
         """
         """
         example full cedar entity
@@ -59,35 +154,30 @@ class EntitySerializer:
         ]
         }
         """
-        attributes = {}  # TODO
-        data = subject.__dict__
-        
-        for k, v in data.items() :
-            if k in ["id", "name"]:
-                continue
-            elif isinstance(v, [int, str, bool, list]) :
-                attributes[k] = v
-            elif isinstance(v, db.Model) :
-                attributes[k] = {
-                    "__entity": {
-                        "type": v.__class__.__name__,
-                        "id": getattr(v, "name", getattr(v, "id", str(v)))
-                    }
-                }
-            else:
-                continue
-            ### missing dict type handling
-
-        cedar_type = subject.__class__.__name__    # TODO
-        object_id = getattr(subject, "id", None) or getattr(subject, "name", None)     # TODO
-
-        parents = []  # TODO
-
-        return {
-            "uid": {"type": cedar_type, "id": object_id},
-            "attrs": attributes,
-            "parents": parents,
+        entity_type = self.entity_type(subject)
+        uid = self.entity_uid(subject)
+        memo = self.request_memo()
+        key = (uid["type"], uid["id"], self.version)
+        if memo is not None and key in memo:
+            return memo[key]
+
+        entity = {
+            "uid": uid,
+            "attrs": entity_type.attributes(subject),
+            "parents": [self.entity_uid(parent) for parent in entity_type.parents(subject)],
         }
+        if memo is not None:
+            memo[key] = entity
+        return entity
+
+    @staticmethod
+    def request_memo() -> dict | None:
+        """Serialized entities of the current request, None outside of a request"""
+        if not has_request_context():
+            return None
+        if "cedar_entities" not in g:
+            g.cedar_entities = {}
+        return g.cedar_entities
 
 
 class CedarClient:
@@ -99,6 +189,10 @@ class CedarClient:
         serializer: EntitySerializer,
         schema: str | None = None,
         verbose: bool = False,
+        cache_size: int = 1024,
+        cache_ttl: float | None = 60.0,
+        validate_requests: bool = False,
+        audit: AuditLogWriter | None = None,
     ):
         """
         Initialize Cedar client
@@ -108,11 +202,180 @@ class CedarClient:
             serializer: Entity serializer for converting Python objects
             schema: Optional Cedar schema for validation
             verbose: Enable verbose logging
+            cache_size: Maximum number of cached decisions, 0 disables caching
+            cache_ttl: Seconds a cached decision stays valid
+            validate_requests: Also check every request against the schema,
+                which makes cedarpy re-parse the schema on each decision
+            audit: Optional asynchronous writer receiving every decision
+
+        Raises:
+            ValueError: if the policies or the schema cannot be parsed
         """
-        self.policies = policies
         self.serializer = serializer
-        self.schema = schema
         self.verbose = verbose
+        self.validate_requests = validate_requests
+        self.cache = DecisionCache(maxsize=cache_size, ttl=cache_ttl)
+        self.metrics = AuthzMetrics()
+        self.audit = audit
+        self.load_policies(policies, schema)
+
+    def load_policies(self, policies: str, schema: str | None = None):
+        """
+        Parse and validate a new policy set and schema, then install them.
+        Cached decisions are keyed by the policy version, and are dropped as
+        soon as the version changes.
+
+        Raises:
+            ValueError: if the policies or the schema cannot be parsed
+        """
+        try:
+            cedarpy.policies_to_json_str(policies)
+        except ValueError as e:
+            raise ValueError(f"Invalid Cedar policies: {e}") from e
+        if schema is not None:
+            self.check_schema(schema)
+        self.policies = policies
+        self.schema = schema
+        # Entities the policies name, e.g. Role::"baseuser": a decision may read them
+        self.policy_entities = set(entity_references(json.loads(cedarpy.policies_to_json_str(policies))))
+        digest = hashlib.sha256(policies.encode("utf-8"))
+        digest.update((schema or "").encode("utf-8"))
+        self.policy_version = digest.hexdigest()
+        self.cache.invalidate()
+
+    @staticmethod
+    def check_schema(schema: str):
+        """
+        cedarpy silently ignores a schema it cannot parse, so probe it once:
+        a parsed schema rejects entities of an undeclared type, an ignored
+        schema lets the permit-all probe policy through.
+        """
+        probe = cedarpy.is_authorized(
+            {
+                "principal": 'SchemaProbe::"0"',
+                "action": 'Action::"probe"',
+                "resource": 'SchemaProbe::"0"',
+                "context": {},
+            },
+            "permit(principal, action, resource);",
+            [{"uid": {"type": "SchemaProbe", "id": "0"}, "attrs": {}, "parents": []}],
+            schema,
+        )
+        if probe.decision != cedarpy.Decision.NoDecision:
+            raise ValueError("Invalid Cedar schema: it could not be parsed")
+
+    def invalidate_entity(self, subject: str | object):
+        """Forget cached decisions made for or about a modified entity"""
+        uid = subject if isinstance(subject, str) else self.serializer.entity_reference(subject)
+        self.cache.invalidate(uid)
+
+    def observe(self, action: str, phase: str, seconds: float):
+        """Record latency, and add it to the Cedar time of the current request"""
+        self.metrics.observe(action, phase, seconds)
+        if has_request_context():
+            g.cedar_seconds = g.get("cedar_seconds", 0.0) + seconds
+
+    def cache_stats(self) -> dict[str, int]:
+        return self.cache.stats()
+
+    def metrics_text(self) -> str:
+        """Latency, decision and cache counters in the Prometheus text format"""
+        return self.metrics.render(self.cache.stats())
+
+    @staticmethod
+    def action_label(action: str) -> str:
+        return action.split('"')[1] if "::" in action else action
+
+    def record(self, principal_uid: str, action: str, resource_uid: str,
+               result: cedarpy.AuthzResult, cached: bool):
+        label = self.action_label(action)
+        self.metrics.count_decision(label, DECISION_LABELS[result.decision])
+        if self.audit is not None:
+            self.audit.submit({
+                "time": time(),
+                "principal": principal_uid,
+                "action": label,
+                "resource": resource_uid,
+                "decision": result.decision.value,
+                "cached": cached,
+                "reasons": result.diagnostics.reasons,
+                "errors": result.diagnostics.errors,
+            })
+
+    def decision_key(self, principal_uid, action, resource_uid, entities_json, context, digests=None):
+        """
+        Cache key of a request. `entities_json` must be the entities the
+        decision can read (see `reachable`): any change to one of them gives
+        a different key, whatever else the request store holds. `digests`
+        keeps per-entity hashes across the requests of a batch.
+        """
+        parts = []
+        for entity in sorted(entities_json, key=lambda e: uid_key(e["uid"])):
+            uid = uid_key(entity["uid"])
+            digest = digests.get(uid) if digests is not None else None
+            if digest is None:
+                digest = hashlib.sha256(
+                    json.dumps(entity, sort_keys=True, default=str).encode("utf-8")
+                ).hexdigest()
+                if digests is not None:
+                    digests[uid] = digest
+            parts.append(digest)
+        attrs = hashlib.sha256("".join(parts).encode("utf-8")).hexdigest()
+        ctx = json.dumps(context, sort_keys=True, default=str)
+        return (principal_uid, action, resource_uid, attrs, ctx, self.policy_version)
+
+    def reachable(self, index: dict, *roots: tuple[str, str], context: dict | None = None) -> list[dict]:
+        """
+        Entities of `index` (UID key -> entity JSON) a decision about `roots`
+        can read: the roots, the entities named by the context and the
+        policies, their ancestors and the entities their attributes
+        reference, transitively.
+        """
+        found = {}
+        pending = [*roots, *entity_references(context or {}), *self.policy_entities]
+        while pending:
+            uid = pending.pop()
+            if uid in found:
+                continue
+            entity = found[uid] = index.get(uid)
+            if entity is not None:
+                pending.extend(uid_key(parent) for parent in entity["parents"])
+                pending.extend(entity_references(entity["attrs"]))
+        return [entity for entity in found.values() if entity is not None]
+
+    def uid_of(self, subject: str | dict | object) -> tuple[str, str]:
+        """UID key of a subject given as a UID string, an entity JSON dict or an object"""
+        if isinstance(subject, str):
+            entity_type, _, identifier = subject.partition("::")
+            return (entity_type, identifier.strip('"'))
+        if isinstance(subject, dict):
+            return uid_key(subject["uid"])
+        return uid_key(self.serializer.entity_uid(subject))
+
+    def reference(self, subject: str | dict | object) -> str:
+        """UID of a subject given as a UID string, an entity JSON dict or an object"""
+        if isinstance(subject, str):
+            return subject
+        if isinstance(subject, dict):
+            return f"{subject['uid']['type']}::\"{subject['uid']['id']}\""
+        return self.serializer.entity_reference(subject)
+
+    @staticmethod
+    def action_reference(action: str) -> str:
+        """Accept bare action names such as `voteThought` as well as full UIDs"""
+        return action if "::" in action else f'Action::"{action}"'
+
+    def entity_store(self, entities: list[dict | object]) -> list[dict]:
+        """
+        Serialize entities that are not dicts already, keeping the first
+        occurrence of each UID so shared entities are sent only once
+        """
+        store = {}
+        for entity in entities:
+            entity_json = entity if isinstance(entity, dict) else self.serializer.entity_json(entity)
+            uid = (entity_json["uid"]["type"], str(entity_json["uid"]["id"]))
+            store.setdefault(uid, entity_json)
+        return list(store.values())
 
     def is_authorized(
         self,
@@ -129,35 +392,36 @@ class CedarClient:
             principal: The entity performing the action (e.g., User object)
             action: The action being performed (e.g., "read", "write")
             resource: The resource being accessed (e.g., Document object)
-            entities: Additional entities needed for policy evaluation
+            entities: Entities needed for policy evaluation, defaults to the
+                request entity store extended with principal and resource
             context: Additional information to attach to the request
 
         Returns:
             Cedar authorization result
         """
-        if isinstance(principal, str):
-            principal_uid = principal
-        else:
-            principal_uid = self.serializer.entity_reference(principal)
-
-        if isinstance(resource, str):
-            resource_uid = resource
-        else:
-            resource_uid = self.serializer.entity_reference(resource)
+        started = perf_counter()
+        principal_uid = self.reference(principal)
+        resource_uid = self.reference(resource)
+        action = self.action_reference(action)
 
-        # By default, include principal and resource in the entity store
+        # By default, add principal and resource to the entity store of the
+        # request, which is shared with every other call made while serving it
         if entities is None:
-            entities = []
-            if not isinstance(principal, str):
-                entities.append(principal)
-            if not isinstance(resource, str):
-                entities.append(resource)
-
-        # Serialize all entities if they are not dicts already
-        entities_json = []
-        for entity in entities:
-            if not isinstance(entity, dict):
-                entities_json.append(self.serializer.entity_json(entity))
+            index = EntityStore.current(self.serializer).add(principal, resource).entities
+        else:
+            # Serialize all entities if they are not dicts already
+            index = {uid_key(e["uid"]): e for e in self.entity_store(entities)}
+        # Only what this decision can read is hashed and sent to Cedar, so the
+        # cost does not grow with everything the request has touched so far
+        entities_json = self.reachable(index, self.uid_of(principal), self.uid_of(resource), context=context)
+
+        key = self.decision_key(principal_uid, action, resource_uid, entities_json, context)
+        serialized = perf_counter()
+        self.observe(self.action_label(action), "serialize", serialized - started)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.record(principal_uid, action, resource_uid, cached, cached=True)
+            return cached
 
         # Build and send authorization request
         request = {
@@ -166,9 +430,93 @@ class CedarClient:
             "resource": resource_uid,
             "context": context,
         }
-        return cedarpy.is_authorized(
-            request, self.policies, entities_json, self.schema, self.verbose
+        # Policies and schema were validated when loaded, re-sending the schema
+        # only buys per-request validation at the price of parsing it again
+        schema = self.schema if self.validate_requests else None
+        result = cedarpy.is_authorized(
+            request, self.policies, entities_json, schema, self.verbose
         )
+        self.observe(self.action_label(action), "evaluate", perf_counter() - serialized)
+        self.record(principal_uid, action, resource_uid, result, cached=False)
+        # NoDecision means evaluation errors, those are not worth remembering
+        if result.decision != cedarpy.Decision.NoDecision:
+            self.cache.put(key, result)
+        return result
+
+    def is_authorized_batch(
+        self,
+        principal: str | object,
+        action: str | list[str],
+        resources: list[str | dict | object],
+        context: dict | list[dict] = {},
+        entities: list[dict | object] | None = None,
+    ) -> list[cedarpy.AuthzResult]:
+        """
+        Authorize one principal against many resources in a single evaluation
+
+        Args:
+            principal: The entity performing the actions
+            action: One action for every resource, or one action per resource
+            resources: The resources being accessed, as objects, entity JSON or UIDs
+            context: One context for every request, or one context per resource
+            entities: Additional entities, merged into the shared entity store
+
+        Returns:
+            Cedar authorization results, in the same order as `resources`
+        """
+        actions = [action] * len(resources) if isinstance(action, str) else action
+        contexts = [context] * len(resources) if isinstance(context, dict) else context
+        if not (len(actions) == len(contexts) == len(resources)):
+            raise ValueError("action and context lists must match the resources")
+
+        started = perf_counter()
+        # One deduplicated entity store shared by every request of the batch,
+        # seeded with the principal and roles already known to this request
+        store = EntityStore.current(self.serializer).add(principal).to_json()
+        store.extend(entities or [])
+        store.extend(r for r in resources if not isinstance(r, str))
+        entities_json = self.entity_store(store)
+        # Each request is keyed on the few entities it can read; their
+        # hashes are shared, so a page costs one hash per entity, not per row
+        by_uid = {uid_key(entity["uid"]): entity for entity in entities_json}
+        digests: dict[tuple[str, str], str] = {}
+        principal_key = self.uid_of(principal)
+
+        principal_uid = self.reference(principal)
+        results: list[cedarpy.AuthzResult | None] = []
+        keys, pending = [], []
+        for index, (act, resource, ctx) in enumerate(zip(actions, resources, contexts)):
+            request = {
+                "principal": principal_uid,
+                "action": self.action_reference(act),
+                "resource": self.reference(resource),
+                "context": ctx,
+            }
+            readable = self.reachable(by_uid, principal_key, self.uid_of(resource), context=ctx)
+            key = self.decision_key(request["principal"], request["action"],
+                                    request["resource"], readable, ctx, digests)
+            cached = self.cache.get(key)
+            results.append(cached)
+            if cached is None:
+                keys.append(key)
+                pending.append((index, request))
+            else:
+                self.record(principal_uid, request["action"], request["resource"], cached, cached=True)
+        serialized = perf_counter()
+        self.observe("batch", "serialize", serialized - started)
+
+        if pending:
+            schema = self.schema if self.validate_requests else None
+            decided = cedarpy.is_authorized_batch(
+                [request for _, request in pending], self.policies, entities_json, schema, self.verbose
+            )
+            self.observe("batch", "evaluate", perf_counter() - serialized)
+            for key, (index, request), result in zip(keys, pending, decided):
+                self.record(principal_uid, request["action"], request["resource"], result, cached=False)
+                if result.decision != cedarpy.Decision.NoDecision:
+                    self.cache.put(key, result)
+                results[index] = result
+        return results
 
     def assert_allowed(
         self,
@@ -184,13 +532,17 @@ class CedarClient:
         Convenience method for when you want to fail fast on unauthorized actions
         """
         result = self.is_authorized(principal, action, resource, context, entities)
+        if result.decision == cedarpy.Decision.Allow:
+            return
+        principal_uid = self.reference(principal)
+        resource_uid = self.reference(resource)
         if result.decision == cedarpy.Decision.Deny:
             raise SecurityException(
-                f"Action '{action}' not allowed for {self.serializer.entity_reference(principal)} on {self.serializer.entity_reference(resource)}"
+                f"Action '{action}' not allowed for {principal_uid} on {resource_uid}"
             )
         elif result.decision == cedarpy.Decision.NoDecision:
             raise SecurityException(
-                f"Failed to decide: action '{action}' for {self.serializer.entity_reference(principal)} on {self.serializer.entity_reference(resource)}\n{result.diagnostics.errors}"
+                f"Failed to decide: action '{action}' for {principal_uid} on {resource_uid}\n{result.diagnostics.errors}"
             )
 
 
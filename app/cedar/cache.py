@@ -0,0 +1,72 @@
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from typing import Any, Hashable
+
+
+class DecisionCache:
+    """Thread-safe LRU cache of Cedar decisions whose entries expire after a TTL"""
+
+    def __init__(self, maxsize: int = 1024, ttl: float | None = 60.0):
+        """
+        Args:
+            maxsize: Maximum number of cached decisions, 0 disables the cache
+            ttl: Seconds a decision stays valid, None keeps it until evicted
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: Hashable) -> Any | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires, value = entry
+            if expires < monotonic():
+                del self._entries[key]
+                self.evictions += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        if self.maxsize <= 0:
+            return
+        expires = monotonic() + self.ttl if self.ttl is not None else float("inf")
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, uid: str | None = None):
+        """
+        Drop every decision, or only those whose principal or resource is `uid`
+        """
+        with self._lock:
+            if uid is None:
+                self.evictions += len(self._entries)
+                self._entries.clear()
+                return
+            stale = [k for k in self._entries if uid in (k[0], k[2])]
+            for key in stale:
+                del self._entries[key]
+            self.evictions += len(stale)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
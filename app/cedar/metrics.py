@@ -0,0 +1,76 @@
+from bisect import bisect_left
+from collections import defaultdict
+from threading import Lock
+
+# Upper bounds in seconds, Cedar decisions usually land well below a millisecond
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5)
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram in the Prometheus layout"""
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float):
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            yield ("+Inf" if bound == float("inf") else repr(bound)), total
+
+
+class AuthzMetrics:
+    """
+    Per-action authorization latency, split into serialization and evaluation,
+    and decision counters, rendered in the Prometheus text exposition format
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.latency: dict[tuple[str, str], Histogram] = {}
+        self.decisions: dict[tuple[str, str], int] = defaultdict(int)
+        self._lock = Lock()
+
+    def observe(self, action: str, phase: str, seconds: float):
+        with self._lock:
+            histogram = self.latency.get((action, phase))
+            if histogram is None:
+                histogram = self.latency[(action, phase)] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def count_decision(self, action: str, decision: str):
+        with self._lock:
+            self.decisions[(action, decision)] += 1
+
+    def render(self, cache_stats: dict[str, int] | None = None) -> str:
+        lines = [
+            "# HELP cedar_authorization_seconds Time spent serializing entities and evaluating policies",
+            "# TYPE cedar_authorization_seconds histogram",
+        ]
+        with self._lock:
+            for (action, phase), histogram in sorted(self.latency.items()):
+                labels = f'action="{action}",phase="{phase}"'
+                for bound, total in histogram.cumulative():
+                    lines.append(f'cedar_authorization_seconds_bucket{{{labels},le="{bound}"}} {total}')
+                lines.append(f"cedar_authorization_seconds_sum{{{labels}}} {histogram.sum}")
+                lines.append(f"cedar_authorization_seconds_count{{{labels}}} {histogram.count}")
+            lines.append("# HELP cedar_decisions_total Authorization decisions by outcome")
+            lines.append("# TYPE cedar_decisions_total counter")
+            for (action, decision), count in sorted(self.decisions.items()):
+                lines.append(f'cedar_decisions_total{{action="{action}",decision="{decision}"}} {count}')
+        if cache_stats is not None:
+            lines.append("# HELP cedar_decision_cache_entries Decisions currently cached")
+            lines.append("# TYPE cedar_decision_cache_entries gauge")
+            lines.append(f"cedar_decision_cache_entries {cache_stats['size']}")
+            for name in ("hits", "misses", "evictions"):
+                lines.append(f"# TYPE cedar_decision_cache_{name}_total counter")
+                lines.append(f"cedar_decision_cache_{name}_total {cache_stats[name]}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,45 @@
+from typing import Any
+
+from flask import g, has_request_context
+
+
+class EntityStore:
+    """
+    Cedar entities gathered while handling one request: the principal, their
+    roles and every resource touched. Each entity is serialized once and the
+    same store is shared by all the authorization calls of the request.
+    """
+
+    def __init__(self, serializer):
+        self.serializer = serializer
+        self.entities: dict[tuple[str, str], dict[str, Any]] = {}
+
+    @classmethod
+    def current(cls, serializer) -> "EntityStore":
+        """Store bound to the current request, a throwaway one outside of requests"""
+        if not has_request_context():
+            return cls(serializer)
+        if "cedar_store" not in g:
+            g.cedar_store = cls(serializer)
+        return g.cedar_store
+
+    def add(self, *subjects: str | dict | object) -> "EntityStore":
+        """
+        Add objects or entity JSON; UID strings carry no attributes and are skipped.
+        Parents are taken from the serialized `parents` list, e.g. the roles already
+        loaded on a user, so adding them costs no query.
+        """
+        for subject in subjects:
+            if isinstance(subject, str):
+                continue
+            entity = subject if isinstance(subject, dict) else self.serializer.entity_json(subject)
+            self.entities[(entity["uid"]["type"], entity["uid"]["id"])] = entity
+            for parent in entity["parents"]:
+                self.entities.setdefault(
+                    (parent["type"], parent["id"]),
+                    {"uid": parent, "attrs": {}, "parents": []},
+                )
+        return self
+
+    def to_json(self) -> list[dict[str, Any]]:
+        return list(self.entities.values())
@@ -0,0 +1,107 @@
+# Application settings, loaded by create_app() before any per-app overrides
+import os
+
+
+class Config:
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:////app/instance/test.db')
+    USER_APP_NAME = "ThoughtSharing"
+    USER_ENABLE_EMAIL = False
+    USER_ENABLE_USERNAME = True
+    USER_REQUIRE_RETYPE_PASSWORD = False
+    USER_UNAUTHORIZED_ENDPOINT = 'main.error'
+    # Shared by every worker; when unset a key is generated once in the instance folder
+    SECRET_KEY = os.environ.get('SECRET_KEY')
+    LOG_LEVEL = 'INFO'
+
+    FEED_PAGE_SIZE = 20
+    FEED_MAX_PAGE_SIZE = 100
+    # Pages with at least this many rows are streamed instead of rendered whole
+    FEED_STREAM_MIN_SIZE = 50
+
+    # Feed pages, rendered rows and row fragments. "memory" is per process, so with several
+    # workers the other workers may serve a page up to FEED_CACHE_TTL seconds
+    # old; "redis" shares the cache, and its invalidations, between workers
+    FEED_CACHE_BACKEND = os.environ.get('FEED_CACHE_BACKEND', 'memory')
+    FEED_CACHE_URL = os.environ.get('FEED_CACHE_URL', 'redis://localhost:6379/0')
+    FEED_CACHE_SIZE = 4096
+    FEED_CACHE_TTL = 30.0
+
+    # Role names per user, read by roles_required and the Cedar principal.
+    # Changes through Domain.add_role_to_user invalidate them at once
+    ROLE_CACHE_SIZE = 4096
+    ROLE_CACHE_TTL = 300.0
+
+    # Snapshots of logged-in users, so authenticated requests skip loading
+    # them. Per process: changes made elsewhere show up within the TTL
+    PRINCIPAL_CACHE_SIZE = 4096
+    PRINCIPAL_CACHE_TTL = 60.0
+
+    # Commit votes from a background thread in micro-batches of up to
+    # VOTE_BATCH_SIZE votes or VOTE_BATCH_INTERVAL seconds. A vote is then
+    # accepted before it is stored; with several processes the limit is
+    # re-checked in the database and excess votes are dropped and logged
+    VOTE_QUEUE_ENABLED = os.environ.get('VOTE_QUEUE_ENABLED', '').lower() in ('1', 'true', 'yes')
+    VOTE_QUEUE_SIZE = 10000
+    VOTE_BATCH_SIZE = 500
+    VOTE_BATCH_INTERVAL = 0.05
+    # How long a request waits for room in a full queue before the vote fails
+    VOTE_QUEUE_TIMEOUT = 0.5
+
+    # /top: the most voted thoughts. The ranking is kept in memory and re-read
+    # from the database every LEADERBOARD_REFRESH seconds (None: only at
+    # start), which brings in the votes taken by other processes
+    TOP_THOUGHTS_SIZE = 10
+    TOP_THOUGHTS_MAX_SIZE = 100
+    LEADERBOARD_REFRESH = 30.0
+
+    # Live feed updates (/events). Each stream holds a server thread (see
+    # `threads` in gunicorn.conf.py) for up to EVENTS_STREAM_SECONDS, after
+    # which the browser reconnects; keep EVENTS_MAX_SUBSCRIBERS per process
+    # below the thread count. A client more than EVENTS_BUFFER_SIZE events
+    # behind is told to reload instead
+    EVENTS_MAX_SUBSCRIBERS = int(os.environ.get('EVENTS_MAX_SUBSCRIBERS', 2))
+    EVENTS_BUFFER_SIZE = 256
+    EVENTS_HEARTBEAT = 15.0
+    EVENTS_STREAM_SECONDS = 120.0
+
+    # Rows per transaction for `flask import-data`
+    BULK_CHUNK_SIZE = 5000
+
+    CEDAR_CACHE_SIZE = 4096
+    CEDAR_CACHE_TTL = 60.0
+    CEDAR_VALIDATE_REQUESTS = False
+    CEDAR_VERBOSE = False
+    # Path of the JSON-lines authorization audit log, None disables it
+    CEDAR_AUDIT_LOG = None
+    # Bearer token a scraper must send to read /metrics; unset hides the endpoint
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+    # Compiled templates, kept across restarts; None means <instance>/jinja-cache
+    JINJA_BYTECODE_CACHE = True
+    JINJA_BYTECODE_CACHE_DIR = os.environ.get('JINJA_BYTECODE_CACHE_DIR')
+
+    # Send query count, SQL, Cedar and template time as a Server-Timing header
+    SERVER_TIMING = True
+    # Statements slower than this are logged with their query plan, None disables
+    SLOW_QUERY_MS = 100
+    # Requests carrying an "X-Profile: <PROFILE_TOKEN>" header are run under
+    # cProfile, one in 1 / PROFILE_SAMPLE_RATE, and dumped into PROFILE_DIR;
+    # either unset disables it
+    PROFILE_DIR = os.environ.get('PROFILE_DIR')
+    PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN')
+    PROFILE_SAMPLE_RATE = 1.0
+
+    # Applied to every new SQLite connection: WAL lets readers proceed while a
+    # writer commits, busy_timeout makes writers queue instead of failing
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'busy_timeout': 5000,
+        'synchronous': 'NORMAL',
+        'mmap_size': 268435456,
+    }
+
+
+class ProductionConfig(Config):
+    LOG_LEVEL = 'WARNING'
+    # Timings tell any client what a request costs
+    SERVER_TIMING = False
@@ -1,14 +1,198 @@
 # backend domain logic : middleware for integration with external apps, self.db
 
-from flask import current_app
+from dataclasses import dataclass, field, replace
+import atexit
+import os
+import time
+from datetime import datetime
+from threading import Lock
+from flask import current_app, has_app_context, has_request_context, request
 from flask_sqlalchemy import SQLAlchemy
-from model import User, Thought, Vote, BASE_USER, OTHER, Role
-from flask_user import UserManager
+from sqlalchemy import and_, bindparam, column, delete, event, func, insert, inspect, or_, select, table, text, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from model import User, Thought, Vote, VoteCounter, BASE_USER, OTHER, Role, UserRoles, THOUGHTS_FTS_DDL, utcnow
+from flask_user import UserManager, UserMixin
+from flask_user.signals import user_changed_password, user_changed_username, user_reset_password
+from flask_user.db_manager import DBManager
 from cedar.authz import SecurityException, EntitySerializer, CedarClient
+from cedar.audit import AuditLogWriter
+from events import EventHub
+from utilities.bulk import as_datetime, as_list, chunked
+from utilities.cache import MemoryBackend, TaggedCache, create_cache
+from utilities.ranking import Leaderboard
+from vote_queue import VoteQueue
 
 
-POLICY_PATH = "./cedar/main.cedar"
-SCHEMA_PATH = "./cedar/main.cedarschema"
+POLICY_PATH = os.path.join(os.path.dirname(__file__), "cedar", "main.cedar")
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), "cedar", "main.cedarschema")
+THOUGHTS_CONTAINER = 'ThoughtsContainer::"thoughts"'
+
+VOTE_LIMIT = 3
+
+FEED_PAGE_SIZE = 20
+FEED_MAX_PAGE_SIZE = 100
+# Cache tags: every feed page, and the pages that end at the newest thought
+FEED_TAG = "feed"
+FEED_TAIL_TAG = "feed-tail"
+
+TOP_THOUGHTS_SIZE = 10
+TOP_THOUGHTS_MAX_SIZE = 100
+
+BULK_CHUNK_SIZE = 5000
+# Field order of `flask export-data`, also the CSV header
+EXPORT_FIELDS = {
+    "users": ["username", "password", "active", "roles"],
+    "thoughts": ["id", "username", "content", "created_at"],
+    "votes": ["username", "thought"],
+}
+
+
+@dataclass(frozen=True)
+class ThoughtRow:
+    """Read-only feed row: everything the thought table renders, no lazy relationships"""
+
+    id: int
+    content: str
+    creator_id: int | None
+    creator: str | None
+    votes: int
+    can_delete: bool = False
+    can_vote: bool = False
+
+
+@dataclass(frozen=True)
+class Principal(UserMixin):
+    """
+    Detached, read-only snapshot of the logged-in user, served by the user
+    loader from the identity cache. `password_tail` is what Flask-User signs
+    into session tokens, so a changed password still ends old sessions.
+    """
+
+    id: int
+    username: str
+    active: bool
+    role_names: frozenset
+    password_tail: str = field(default="", repr=False)
+
+    @property
+    def is_active(self):
+        return self.active
+
+    def get_id(self):
+        return current_app.user_manager.generate_token(self.id, self.password_tail)
+
+
+@dataclass
+class FeedPage:
+    """One keyset-paginated slice of the thought feed, ordered by `Thought.id`"""
+
+    items: list = field(default_factory=list)
+    next_cursor: int | None = None
+    prev_cursor: int | None = None
+    size: int = FEED_PAGE_SIZE
+    # Cache bookkeeping: the thoughts this page depends on, when it was read and
+    # the tag versions it is valid for (None when it could not be cached)
+    key: str = ""
+    tags: list = field(default_factory=list)
+    computed_at: float = 0.0
+    versions: dict | None = None
+
+
+@dataclass
+class SearchPage:
+    """One page of full-text matches, best first; cursors are opaque strings"""
+
+    query: str
+    items: list = field(default_factory=list)
+    next_cursor: str | None = None
+    size: int = FEED_PAGE_SIZE
+
+
+@dataclass(frozen=True)
+class TimelineRow:
+    """A thought on its author's timeline, read from ix_thoughts_user_timeline alone"""
+
+    id: int
+    content: str
+    created_at: datetime | None
+
+
+@dataclass
+class TimelinePage:
+    """One page of a user's thoughts, newest first; `next_cursor` leads to older ones"""
+
+    user_id: int
+    items: list = field(default_factory=list)
+    next_cursor: int | None = None
+    size: int = FEED_PAGE_SIZE
+
+
+# FTS5 table created by model.THOUGHTS_FTS_DDL; `rank` is bm25, lower is better
+thoughts_fts = table("thoughts_fts", column("rowid"), column("rank"))
+
+
+def match_expression(query):
+    """
+    Turn free text into an FTS5 query: every word must match, quoted so user
+    input cannot inject FTS syntax; a trailing `*` keeps its prefix meaning.
+    """
+    terms = []
+    for word in query.split():
+        prefix = word.endswith("*")
+        word = word.rstrip("*")
+        if word:
+            terms.append('"' + word.replace('"', '""') + '"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+
+def thought_tag(thought_id):
+    return f"thought:{thought_id}"
+
+
+def roles_tag(user_id):
+    return f"roles:{user_id}"
+
+
+def user_tag(user_id):
+    return f"user:{user_id}"
+
+
+class RoleCachingDBManager(DBManager):
+    """Flask-User's DBManager, answering role checks from the domain's role cache"""
+
+    def __init__(self, domain, *args, **kwargs):
+        self.domain = domain
+        super().__init__(*args, **kwargs)
+
+    def get_user_roles(self, user):
+        if isinstance(user, Principal):
+            return sorted(user.role_names)
+        return sorted(self.domain.user_roles(user.id))
+
+
+class DomainUserManager(UserManager):
+    """UserManager whose `roles_required` and `has_roles` skip loading `User.roles`"""
+
+    def __init__(self, app, db, UserClass, domain, **kwargs):
+        self.domain = domain
+        super().__init__(app, db, UserClass, **kwargs)
+
+    def customize(self, app):
+        current = self.db_manager
+        self.db_manager = RoleCachingDBManager(self.domain, app, current.db, current.UserClass,
+                                               current.UserEmailClass, current.UserInvitationClass,
+                                               current.RoleClass)
+        self.login_manager.user_loader(self.domain.load_principal)
+
+
+def entities_flushed(session, flush_context):
+    """Anything flushed may have changed attributes the current app's Cedar client serialized"""
+    if has_app_context():
+        domain = current_app.extensions.get('domain')
+        if domain is not None:
+            domain._entities_changed()
 
 
 class Domain:
@@ -16,34 +200,186 @@ class Domain:
     def __init__(self, app=None, db=None):
         if db:
             self.db = db
+        self.config = {}
+        self.feed_cache = TaggedCache(MemoryBackend())
+        self.role_cache = TaggedCache(MemoryBackend())
+        self.user_cache = TaggedCache(MemoryBackend())
+        self.events = EventHub()
+        self.events.add_listener(self._leaderboard_changed)
+        self._leaderboard = Leaderboard()
+        self._leaderboard_lock = Lock()
+        self._roles = None
+        self._roles_lock = Lock()
+        self._cedar = None
+        self._cedar_lock = Lock()
+        self._vote_queue = None
+        self._vote_queue_lock = Lock()
+        if app:
+            self.init_app(app)
+
+    
+    def init_app(self, app):
+        """
+        Bind to an application without touching the database or the policy
+        files: schema creation and seeding live in `flask init-db`, and the
+        Cedar client is built on first use.
+        """
+        self.config = app.config
+        self.feed_cache = create_cache(app.config)
+        self.role_cache = create_cache(app.config, size=app.config.get('ROLE_CACHE_SIZE'),
+                                       ttl=app.config.get('ROLE_CACHE_TTL'))
+        # Process-local on purpose: a session is checked on every request
+        self.user_cache = TaggedCache(MemoryBackend(maxsize=app.config.get('PRINCIPAL_CACHE_SIZE', 4096)),
+                                      ttl=app.config.get('PRINCIPAL_CACHE_TTL', 60.0))
+        self.events = EventHub(buffer_size=app.config.get('EVENTS_BUFFER_SIZE', 256),
+                               max_subscribers=app.config.get('EVENTS_MAX_SUBSCRIBERS'))
+        self.events.add_listener(self._leaderboard_changed)
         self.initialise_domain(app=app)
-        self.initialise_cedar()
+        if getattr(self, 'db', None):
+            # The session is shared by every app: one listener finds the right domain
+            if not event.contains(self.db.session, 'after_flush', entities_flushed):
+                event.listen(self.db.session, 'after_flush', entities_flushed)
+            # Flask-User's own views change users without going through the domain
+            for signal in (user_changed_password, user_reset_password):
+                signal.connect(self._user_signal, sender=app, weak=False)
+            user_changed_username.connect(self._username_signal, sender=app, weak=False)
+        app.extensions['domain'] = self
 
     
     def initialise_domain(self, app):
         if app and self.db:
-            with app.app_context():
-                self.db.create_all()
-                roles = Role.query.all()
-                if len(roles) == 0:
+            self.user_manager = DomainUserManager(app, self.db, User, domain=self)
+
+    
+    def initialise_database(self):
+        """
+        Create missing tables and seed the static roles, run by `flask init-db`.
+        Databases created before the denormalized vote counters or the
+        thoughts' creation time get them added, which queries on thoughts
+        cannot do without.
+        """
+        try:
+            self.db.create_all()
+            columns = [c["name"] for c in inspect(self.db.engine).get_columns("thoughts")]
+            if "vote_count" not in columns:
+                s, errmsg = self.rebuild_vote_counters()
+                if not s:
+                    return False, errmsg
+            if "created_at" not in columns or self.outdated_thought_indexes():
+                s, errmsg = self.rebuild_timeline_index()
+                if not s:
+                    return False, errmsg
+            roles = Role.query.all()
+            if len(roles) == 0:
+                try:
                     self.db.session.add(Role(name=BASE_USER))
                     self.db.session.add(Role(name=OTHER))
                     self.db.session.commit()
-            self.user_manager = UserManager(app, self.db, User)
+                except IntegrityError:
+                    # Another process seeded the roles first
+                    self.db.session.rollback()
+            return True, ""
+        except Exception as e:
+            self.db.session.rollback()
+            return False, str(e)
+
+    
+    @property
+    def cedar(self):
+        if self._cedar is None:
+            with self._cedar_lock:
+                if self._cedar is None:
+                    self._cedar = self.initialise_cedar(self.config)
+        return self._cedar
+
+    
+    @property
+    def vote_queue(self):
+        """Background vote writer when VOTE_QUEUE_ENABLED, started on first use (after a fork)"""
+        if not self.config.get('VOTE_QUEUE_ENABLED'):
+            return None
+        if self._vote_queue is None:
+            with self._vote_queue_lock:
+                if self._vote_queue is None:
+                    app = current_app._get_current_object()
+
+                    def write(batch):
+                        with app.app_context():
+                            return self.write_votes(batch)
+
+                    self._vote_queue = VoteQueue(write,
+                                                 maxsize=self.config.get('VOTE_QUEUE_SIZE', 10000),
+                                                 batch_size=self.config.get('VOTE_BATCH_SIZE', 500),
+                                                 interval=self.config.get('VOTE_BATCH_INTERVAL', 0.05),
+                                                 put_timeout=self.config.get('VOTE_QUEUE_TIMEOUT', 0.5))
+                    atexit.register(self._vote_queue.close)
+        return self._vote_queue
+
+    
+    def _user_signal(self, sender, user, **extra):
+        self.user_changed(user.id)
+
+    
+    def _username_signal(self, sender, user, **extra):
+        # Feed pages show usernames, which are not tagged per user
+        self.feed_cache.invalidate(FEED_TAG)
+        self.user_changed(user.id)
+
+    
+    def _entities_changed(self, *args):
+        if self._cedar is not None:
+            self._cedar.serializer.invalidate()
 
     
-    def initialise_cedar(self):
+    def initialise_cedar(self, config=None):
+        """
+        Parse and validate the policy set and schema once. Invalid files raise
+        here; `flask init-db` and `flask check-policies` run it at deploy time
+        so a broken policy is caught before the first request needs it.
+        """
+        config = config or {}
         serializer = EntitySerializer()
+        self.register_entities(serializer)
         with open(POLICY_PATH, "r", encoding="utf-8") as policy_file:
             policies = policy_file.read()
-            try:
-                with open(SCHEMA_PATH, "r", encoding="utf-8") as schema_file:
-                    schema = schema_file.read()
-                    self.cedar = CedarClient(policies, serializer, schema, verbose = True)
-            except FileNotFoundError:
-                schema = None
+        try:
+            with open(SCHEMA_PATH, "r", encoding="utf-8") as schema_file:
+                schema = schema_file.read()
+        except FileNotFoundError:
+            schema = None
+        audit = None
+        if config.get('CEDAR_AUDIT_LOG'):
+            audit = AuditLogWriter(config['CEDAR_AUDIT_LOG'])
+            atexit.register(audit.close)
+        return CedarClient(policies, serializer, schema,
+                           verbose=config.get('CEDAR_VERBOSE', False),
+                           cache_size=config.get('CEDAR_CACHE_SIZE', 1024),
+                           cache_ttl=config.get('CEDAR_CACHE_TTL', 60.0),
+                           validate_requests=config.get('CEDAR_VALIDATE_REQUESTS', False),
+                           audit=audit)
+    
     
     
+    def register_entities(self, serializer):
+        """Map the models, and the feed row DTO, onto the entity types of main.cedarschema"""
+        def user_uid(user_id):
+            return {"__entity": {"type": "User", "id": str(user_id)}}
+
+        serializer.register(User, "User",
+                            lambda u: {"username": u.username},
+                            lambda u: [{"type": "Role", "id": name} for name in sorted(self.user_roles(u.id))])
+        serializer.register(Principal, "User",
+                            lambda p: {"username": p.username},
+                            lambda p: [{"type": "Role", "id": name} for name in sorted(p.role_names)])
+        serializer.register(Role, "Role", lambda r: {})
+        serializer.register(Thought, "Thought",
+                            lambda t: {"creator": user_uid(t.user)})
+        serializer.register(ThoughtRow, "Thought",
+                            lambda r: {"creator": user_uid(r.creator_id)})
+        serializer.register(Vote, "Vote",
+                            lambda v: {"voter": user_uid(v.person),
+                                       "thought": {"__entity": {"type": "Thought", "id": str(v.thought)}}})
+    
     
     def create_user(self, username, password):
         try:
@@ -76,6 +412,50 @@ class Domain:
             return False, str(e)
 
     
+    def load_principal(self, user_token):
+        """
+        Flask-Login user loader: the signed session token names the user and
+        the tail of their password hash, both checked against the cached
+        snapshot. Flask-User's account views edit `current_user`, so they
+        get the ORM user instead.
+        """
+        data = self.user_manager.verify_token(user_token, None)
+        if not data:
+            return None
+        user_id, password_tail = data
+        if has_request_context() and (request.endpoint or "").startswith("user."):
+            user = self.db.session.get(User, user_id)
+            return user if user and user.password[-8:] == password_tail else None
+        principal = self.get_principal(user_id)
+        if principal is not None and principal.password_tail != password_tail:
+            # Possibly changed in another process since it was cached
+            principal = self.get_principal(user_id, refresh=True)
+        if principal is None or principal.password_tail != password_tail:
+            return None
+        return principal
+
+    
+    def get_principal(self, user_id, refresh=False):
+        """Cached Principal of a user, None if there is no such user"""
+        key = f"principal:{user_id}"
+        if not refresh:
+            cached = self.user_cache.get(key)
+            if cached is not None:
+                return cached[0]
+        marker = self.user_cache.write_marker()
+        user = self.db.session.get(User, user_id)
+        if user is None:
+            return None
+        principal = Principal(id=user.id, username=user.username, active=bool(user.active),
+                              role_names=self.user_roles(user.id), password_tail=user.password[-8:])
+        self.user_cache.set(key, principal, [user_tag(user.id)], marker)
+        return principal
+
+    
+    def user_changed(self, user_id):
+        self.user_cache.invalidate(user_tag(user_id))
+
+    
     def update_user(self, user_id, updates):
         try:
             user = User.query.get(user_id)
@@ -85,6 +465,9 @@ class Domain:
                 if hasattr(user, key):
                     setattr(user, key, value)
             self.db.session.commit()
+            # Feed rows show usernames, which are not tagged per user
+            self.feed_cache.invalidate(FEED_TAG)
+            self.user_changed(user_id)
             return True, user
         except Exception as e:
             self.db.session.rollback()
@@ -98,6 +481,9 @@ class Domain:
                 return False, "User not found"
             self.db.session.delete(user)
             self.db.session.commit()
+            self.feed_cache.invalidate(FEED_TAG)
+            self.role_cache.invalidate(roles_tag(user_id))
+            self.user_changed(user_id)
             return True, ""
         except Exception as e:
             self.db.session.rollback()
@@ -105,13 +491,15 @@ class Domain:
 
     def create_thought_userid(self, content, user):
         try:
-            thought = Thought(content=content, person=user.id)
-            thought.createdBy = user
+            thought = Thought(content=content, user=user.id)
             if hasattr(self, 'cedar'):
-                self.cedar.assert_allowed(principal=user, action="createThought", resource=Thought)
+                self.cedar.assert_allowed(principal=user, action="createThought", resource=THOUGHTS_CONTAINER)
             if self.db:
                 self.db.session.add(thought)
                 self.db.session.commit()
+                self.feed_cache.invalidate(FEED_TAIL_TAG)
+                self.events.publish("thought", id=thought.id, content=thought.content,
+                                    creator_id=user.id, creator=user.username)
             return True, thought
         except SecurityException as se:
             if self.db:
@@ -145,7 +533,213 @@ class Domain:
             return False, str(e)
 
     
-    def get_thoughts_by_user(person_id):
+    def feed_page_size(self, page_size=None):
+        default = current_app.config.get('FEED_PAGE_SIZE', FEED_PAGE_SIZE)
+        maximum = current_app.config.get('FEED_MAX_PAGE_SIZE', FEED_MAX_PAGE_SIZE)
+        if not page_size or page_size < 1:
+            return default
+        return min(page_size, maximum)
+
+    
+    def get_thoughts_page(self, after=None, before=None, page_size=None):
+        """
+        Keyset pagination over thoughts: `after` returns the page following the
+        given thought id, `before` the page preceding it. Every page is a single
+        indexed range scan on the primary key, so its cost does not depend on
+        the size of the table.
+        """
+        try:
+            size = self.feed_page_size(page_size)
+            key = f"feed:{after}:{before}:{size}"
+            cached = self.feed_cache.get(key)
+            if cached is not None:
+                return True, replace(cached[0], versions=cached[1])
+            marker = self.feed_cache.write_marker()
+            page = FeedPage(size=size, key=key, computed_at=time.time())
+            # The look-ahead row decides whether there is a further page, so it
+            # is tagged as well: deleting it changes this page's cursors
+            if before is not None:
+                stmt = self.feed_statement().where(Thought.id < before) \
+                    .order_by(Thought.id.desc()).limit(size + 1)
+                rows = [ThoughtRow(*r) for r in self.db.session.execute(stmt)]
+                has_more = len(rows) > size
+                page.items = list(reversed(rows[:size]))
+                if page.items:
+                    page.next_cursor = page.items[-1].id
+                    page.prev_cursor = page.items[0].id if has_more else None
+            else:
+                stmt = self.feed_statement()
+                if after is not None:
+                    stmt = stmt.where(Thought.id > after)
+                stmt = stmt.order_by(Thought.id.asc()).limit(size + 1)
+                rows = [ThoughtRow(*r) for r in self.db.session.execute(stmt)]
+                has_more = len(rows) > size
+                page.items = rows[:size]
+                if page.items:
+                    page.next_cursor = page.items[-1].id if has_more else None
+                    page.prev_cursor = page.items[0].id if after is not None else None
+                if not has_more:
+                    # New thoughts get the highest ids and only show up on the last page
+                    page.tags.append(FEED_TAIL_TAG)
+            page.tags.extend(thought_tag(row.id) for row in rows)
+            page.tags.append(FEED_TAG)
+            versions = self.feed_cache.set(key, page, page.tags, marker)
+            return True, replace(page, versions=versions)
+        except Exception as e:
+            return False, str(e)
+
+    
+    def feed_statement(self):
+        """
+        Thoughts joined with their creator's username and denormalized vote
+        count, fetched as plain column tuples in a single SELECT per page.
+        """
+        return select(
+            Thought.id,
+            Thought.content,
+            Thought.user,
+            User.username,
+            Thought.vote_count,
+        ).outerjoin(User, User.id == Thought.user)
+
+    
+    def search_thoughts(self, query, cursor=None, page_size=None):
+        """
+        Ranked full-text search. The cursor is the (rank, id) of the last row
+        of the previous page, so paging is a keyset over the match order.
+        """
+        try:
+            size = self.feed_page_size(page_size)
+            page = SearchPage(query=query, size=size)
+            expression = match_expression(query or "")
+            if not expression:
+                return True, page
+            stmt = self.feed_statement().add_columns(thoughts_fts.c.rank) \
+                .join(thoughts_fts, thoughts_fts.c.rowid == Thought.id) \
+                .where(text("thoughts_fts MATCH :match").bindparams(match=expression))
+            if cursor:
+                try:
+                    rank, last_id = cursor.split(":")
+                    rank, last_id = float(rank), int(last_id)
+                except ValueError:
+                    return False, "Invalid cursor"
+                stmt = stmt.where(or_(thoughts_fts.c.rank > rank,
+                                      and_(thoughts_fts.c.rank == rank, Thought.id > last_id)))
+            stmt = stmt.order_by(thoughts_fts.c.rank, Thought.id).limit(size + 1)
+            rows = self.db.session.execute(stmt).all()
+            page.items = [ThoughtRow(*r[:-1]) for r in rows[:size]]
+            if len(rows) > size:
+                last = rows[size - 1]
+                page.next_cursor = f"{last.rank!r}:{last.id}"
+            return True, page
+        except Exception as e:
+            return False, str(e)
+
+    
+    def rebuild_search_index(self):
+        """
+        Migration/backfill: create the FTS5 table and its triggers on databases
+        created before them, drop the old B-tree index on `thoughts.content`
+        and reindex every thought.
+        """
+        try:
+            self.db.create_all()
+            for statement in THOUGHTS_FTS_DDL:
+                self.db.session.execute(text(statement))
+            self.db.session.execute(text("DROP INDEX IF EXISTS ix_thoughts_content"))
+            self.db.session.execute(text("INSERT INTO thoughts_fts(thoughts_fts) VALUES ('rebuild')"))
+            self.db.session.commit()
+            return True, ""
+        except Exception as e:
+            self.db.session.rollback()
+            return False, str(e)
+
+    
+    def annotate_permissions(self, user, rows):
+        """
+        Resolve `can_delete` and `can_vote` for a page of feed rows with one
+        batched Cedar evaluation over a shared entity store.
+        """
+        try:
+            if not rows:
+                return True, rows
+            ids = [row.id for row in rows]
+            counts = dict(self.db.session.execute(
+                select(VoteCounter.thought, VoteCounter.count)
+                .where(VoteCounter.person == user.id, VoteCounter.thought.in_(ids))
+            ).all())
+            actions = ["deleteThought"] * len(rows) + ["voteThought"] * len(rows)
+            contexts = [{}] * len(rows) + [{"personalVoteCount": counts.get(i, 0)} for i in ids]
+            results = self.cedar.is_authorized_batch(user, actions, rows + rows, contexts)
+            n = len(rows)
+            return True, [
+                replace(row, can_delete=results[i].allowed, can_vote=results[n + i].allowed)
+                for i, row in enumerate(rows)
+            ]
+        except Exception as e:
+            return False, str(e)
+
+    
+    def top_thoughts(self, n=None):
+        """
+        The `n` most voted thoughts as feed rows, ties going to the older one.
+        The ranking lives in memory and follows this process's votes and
+        deletions; it is read from the database on first use and again every
+        LEADERBOARD_REFRESH seconds, which picks up other processes' writes.
+        """
+        try:
+            default = self.config.get('TOP_THOUGHTS_SIZE', TOP_THOUGHTS_SIZE)
+            maximum = self.config.get('TOP_THOUGHTS_MAX_SIZE', TOP_THOUGHTS_MAX_SIZE)
+            n = max(1, min(n or default, maximum))
+            if self.leaderboard_stale():
+                with self._leaderboard_lock:
+                    if self.leaderboard_stale():
+                        self.rebuild_leaderboard()
+            ids = [thought_id for thought_id, _ in self._leaderboard.top(n)]
+            rows = [ThoughtRow(*r) for r in self.db.session.execute(
+                self.feed_statement().where(Thought.id.in_(ids)))]
+            # The rows carry the committed counts, which have the last word
+            return True, sorted(rows, key=lambda row: (-row.votes, row.id))
+        except Exception as e:
+            return False, str(e)
+
+    
+    def leaderboard_stale(self):
+        built_at = self._leaderboard.built_at
+        refresh = self.config.get('LEADERBOARD_REFRESH', 30.0)
+        return built_at is None or (refresh is not None and time.monotonic() - built_at > refresh)
+
+    
+    def rebuild_leaderboard(self):
+        self._leaderboard.rebuild(self.db.session.execute(select(Thought.id, Thought.vote_count)).all())
+
+    
+    def _leaderboard_changed(self, change):
+        board = self._leaderboard
+        if board.built_at is None:
+            # Not read yet: the first rebuild sees this change in the database
+            return
+        if change["type"] == "votes":
+            board.add(change["thought"], change["delta"])
+        elif change["type"] == "thought":
+            board.set(change["id"], 0)
+        elif change["type"] == "delete":
+            board.discard(change["thought"])
+
+    
+    def rank_thoughts_sql(self, n):
+        """Brute-force reference ranking counted from the votes table: [(id, votes)]"""
+        votes = func.count(Vote.id)
+        return self.db.session.execute(
+            select(Thought.id, votes)
+            .outerjoin(Vote, Vote.thought == Thought.id)
+            .group_by(Thought.id)
+            .order_by(votes.desc(), Thought.id)
+            .limit(n)
+        ).all()
+
+    
+    def get_thoughts_by_user(self, person_id):
         try:
             thoughts = Thought.query.filter_by(user=person_id).all()
             return True, thoughts
@@ -153,6 +747,68 @@ class Domain:
             return False, str(e)
 
     
+    def get_user_timeline(self, person_id, before=None, since=None, until=None, page_size=None):
+        """
+        A user's thoughts, newest first. `before` is the cursor, the id of the
+        last thought of the previous page; `since` and `until` keep thoughts
+        created in [since, until). The page's ids come from a range scan of
+        ix_thoughts_user_timeline, then only their contents are read from the
+        table, by primary key.
+        """
+        try:
+            size = self.feed_page_size(page_size)
+            ids = select(Thought.id).where(Thought.user == person_id)
+            if before is not None:
+                ids = ids.where(Thought.id < before)
+            if since is not None:
+                ids = ids.where(Thought.created_at >= since)
+            if until is not None:
+                ids = ids.where(Thought.created_at < until)
+            ids = ids.order_by(Thought.id.desc()).limit(size + 1)
+            rows = [TimelineRow(*r) for r in self.db.session.execute(
+                select(Thought.id, Thought.content, Thought.created_at)
+                .where(Thought.id.in_(ids.scalar_subquery()))
+                .order_by(Thought.id.desc()))]
+            page = TimelinePage(user_id=person_id, items=rows[:size], size=size)
+            if len(rows) > size:
+                page.next_cursor = page.items[-1].id
+            return True, page
+        except Exception as e:
+            return False, str(e)
+
+    
+    def rebuild_timeline_index(self):
+        """
+        Migration: add `thoughts.created_at` to databases created before it
+        existed (older thoughts keep NULL), replace the index on `thoughts.user`
+        with the timeline index and recreate indexes defined differently, such
+        as the timeline index that used to hold every thought's content.
+        """
+        try:
+            self.db.create_all()
+            columns = [c["name"] for c in inspect(self.db.engine).get_columns("thoughts")]
+            outdated = self.outdated_thought_indexes()
+            if "created_at" not in columns:
+                self.db.session.execute(text("ALTER TABLE thoughts ADD COLUMN created_at DATETIME"))
+            self.db.session.execute(text("DROP INDEX IF EXISTS ix_thoughts_user"))
+            connection = self.db.session.connection()
+            for index in outdated:
+                index.drop(bind=connection, checkfirst=True)
+                index.create(bind=connection)
+            self.db.session.commit()
+            return True, ""
+        except Exception as e:
+            self.db.session.rollback()
+            return False, str(e)
+
+    
+    def outdated_thought_indexes(self):
+        """Indexes of Thought missing from the database or defined differently there"""
+        existing = {i["name"]: i["column_names"] for i in inspect(self.db.engine).get_indexes("thoughts")}
+        return [index for index in Thought.__table__.indexes
+                if existing.get(index.name) != [c.name for c in index.columns]]
+
+    
     def get_thought_by_id(self, thought_id):
         try:
             thought = Thought.query.get(thought_id)
@@ -163,14 +819,32 @@ class Domain:
             return False, str(e)
 
     
-    def update_thought(self, thought_id, content):
+    def get_thought_row(self, thought_id):
+        """One thought as a feed row"""
+        try:
+            row = self.db.session.execute(self.feed_statement().where(Thought.id == thought_id)).first()
+            if row is None:
+                return False, "Thought not found"
+            return True, ThoughtRow(*row)
+        except Exception as e:
+            return False, str(e)
+
+    
+    def update_thought(self, thought_id, content, user=None):
         try:
             thought = Thought.query.get(thought_id)
             if not thought:
                 return False, "Thought not found"
+            if user is not None:
+                self.cedar.assert_allowed(principal=user, action="updateThought", resource=thought)
             thought.content = content
             self.db.session.commit()
+            self.feed_cache.invalidate(thought_tag(thought_id))
+            self.events.publish("edit", thought=thought.id, content=content)
             return True, thought
+        except SecurityException as se:
+            self.db.session.rollback()
+            raise se
         except Exception as e:
             self.db.session.rollback()
             return False, str(e)
@@ -183,8 +857,11 @@ class Domain:
                 return False, "Thought not found"
             if hasattr(self, 'cedar'):
                 self.cedar.assert_allowed(principal=user, action="deleteThought", resource=thought)
+            self.db.session.execute(delete(VoteCounter).where(VoteCounter.thought == thought.id))
             self.db.session.delete(thought)
             self.db.session.commit()
+            self.feed_cache.invalidate(thought_tag(thought.id))
+            self.events.publish("delete", thought=thought.id)
             return True, ""
         except SecurityException as se:
             if self.db:
@@ -198,22 +875,126 @@ class Domain:
 
     def check_vote_limit(self, person_id, thought_id):
         try:
-            rs, votes = self.get_votes_by_thought_user(thought_id, person_id)
-            if not rs:
-                return False
-            if len(votes) >= 3:
-                return False
-            return True
+            return self.get_user_vote_count(person_id, thought_id) < VOTE_LIMIT
         except Exception as e:
             raise e
 
+    
+    def get_user_vote_count(self, person_id, thought_id):
+        # A query rather than session.get: reserve_vote updates the counter
+        # behind the identity map, which would otherwise return a stale count
+        count = self.db.session.execute(
+            select(VoteCounter.count)
+            .where(VoteCounter.person == person_id, VoteCounter.thought == thought_id)
+        ).scalar()
+        return count or 0
+
+    
+    def get_vote_count(self, thought_id):
+        try:
+            count = self.db.session.execute(
+                select(Thought.vote_count).where(Thought.id == thought_id)
+            ).scalar()
+            if count is None:
+                return False, "Thought not found"
+            return True, count
+        except Exception as e:
+            return False, str(e)
+
+    
+    def reserve_vote(self, person_id, thought_id):
+        """
+        Guarded upsert on the per-user counter: it only increments while the
+        count is below VOTE_LIMIT, so the check and the write are one statement.
+        Being the first write of the transaction it also takes SQLite's write
+        lock, which serializes concurrent voters on the limit check.
+        """
+        result = self.db.session.execute(
+            sqlite_insert(VoteCounter)
+            .values(person=person_id, thought=thought_id, count=1)
+            .on_conflict_do_update(
+                index_elements=[VoteCounter.person, VoteCounter.thought],
+                set_={"count": VoteCounter.count + 1},
+                where=VoteCounter.count < VOTE_LIMIT,
+            )
+        )
+        return result.rowcount == 1
+
+    
+    def update_thought_vote_count(self, thought_id, delta):
+        self.db.session.execute(
+            update(Thought)
+            .where(Thought.id == thought_id)
+            .values(vote_count=Thought.vote_count + delta)
+            .execution_options(synchronize_session=False)
+        )
+
+    
+    def update_vote_counters(self, person_id, thought_id, delta):
+        """
+        Apply `delta` to both denormalized counters in the current transaction.
+        Both statements are computed in SQL so concurrent writers never lose updates.
+        """
+        self.update_thought_vote_count(thought_id, delta)
+        self.db.session.execute(
+            sqlite_insert(VoteCounter)
+            .values(person=person_id, thought=thought_id, count=max(delta, 0))
+            .on_conflict_do_update(
+                index_elements=[VoteCounter.person, VoteCounter.thought],
+                set_={"count": VoteCounter.count + delta},
+            )
+        )
+
+    
+    def rebuild_vote_counters(self):
+        """
+        Migration/backfill: add `thoughts.vote_count` and the `votes` indexes to
+        databases created before they existed, then recompute every counter
+        from the `votes` table.
+        """
+        try:
+            self.db.create_all()
+            for index in Vote.__table__.indexes:
+                index.create(bind=self.db.engine, checkfirst=True)
+            columns = [c["name"] for c in inspect(self.db.engine).get_columns("thoughts")]
+            if "vote_count" not in columns:
+                self.db.session.execute(text(
+                    "ALTER TABLE thoughts ADD COLUMN vote_count INTEGER NOT NULL DEFAULT 0"
+                ))
+            self.db.session.execute(
+                update(Thought).values(
+                    vote_count=select(func.count(Vote.id))
+                    .where(Vote.thought == Thought.id)
+                    .scalar_subquery()
+                ).execution_options(synchronize_session=False)
+            )
+            self.db.session.execute(delete(VoteCounter))
+            self.db.session.execute(
+                sqlite_insert(VoteCounter).from_select(
+                    ["person", "thought", "count"],
+                    select(Vote.person, Vote.thought, func.count(Vote.id))
+                    .where(Vote.person.is_not(None), Vote.thought.is_not(None))
+                    .group_by(Vote.person, Vote.thought),
+                )
+            )
+            self.db.session.commit()
+            self.feed_cache.invalidate(FEED_TAG)
+            self._leaderboard.invalidate()
+            return True, ""
+        except Exception as e:
+            self.db.session.rollback()
+            return False, str(e)
+
+    
     def create_vote_userid_thoughtid(self, person_id, thought_id):
         try:
-            vote = Vote(person=person_id, thought=thought_id)
-            if not self.check_vote_limit(person_id, thought_id):
+            if not self.reserve_vote(person_id, thought_id):
                 raise SecurityException("You have reached the maximum number of votes for this thought")
-            self.db.session.add(vote)
+            self.db.session.add(Vote(person=person_id, thought=thought_id))
+            self.update_thought_vote_count(thought_id, 1)
             self.db.session.commit()
+            self.feed_cache.invalidate(thought_tag(thought_id))
+            self.events.publish("votes", thought=thought_id, delta=1)
             return True, ""
         except Exception as e:
             self.db.session.rollback()
@@ -221,21 +1002,141 @@ class Domain:
     
     
     def create_vote_username(self, thought_id, username):
+        s, user = self.get_user_by_username(username)
+        if not s:
+            return False, user
+        return self.create_vote_user(thought_id, user)
+
+    
+    def create_vote_user(self, thought_id, user):
+        """
+        Authorize and record a vote of `user`, a User or a Principal. Raises
+        SecurityException when the policies or the vote limit refuse it.
+        """
         try:
-            user = Domain.get_user_by_username(username)
-            thought = Domain.get_thought_by_id(thought_id)
+            s, thought = self.get_thought_by_id(thought_id)
+            if not s:
+                return False, thought
+            queue = self.vote_queue
             if hasattr(self, 'cedar'):
-                self.cedar.assert_allowed(principal=user, action="voteThought", resource=thought)
-            rs, errsmg = self.create_vote_userid_thoughtid(person_id=user.id, thought_id=thought_id)
+                if queue is not None:
+                    votes = queue.count(user.id, thought.id,
+                                        lambda: self.get_user_vote_count(user.id, thought.id))
+                else:
+                    votes = self.get_user_vote_count(user.id, thought.id)
+                context = {"personalVoteCount": votes}
+                self.cedar.assert_allowed(principal=user, action="voteThought", resource=thought, context=context)
+            if queue is not None:
+                s, errmsg = queue.submit(user.id, thought.id,
+                                         lambda: self.get_user_vote_count(user.id, thought.id), VOTE_LIMIT)
+                if not s and errmsg == VoteQueue.LIMIT_REACHED:
+                    raise SecurityException(errmsg)
+                return s, errmsg
+            rs, errsmg = self.create_vote_userid_thoughtid(person_id=user.id, thought_id=thought.id)
             if not rs:
                 return False, errsmg
             return True, ""
         except SecurityException as se:
-            return False, str(se)
+            raise se
         except Exception as e:
             return False, str(e)
 
     
+    def write_votes(self, votes):
+        """
+        Commit a batch of queued (person, thought) votes in one transaction.
+        Each vote still goes through the guarded counter upsert, so the limit
+        holds across processes; returns the votes that were stored.
+        """
+        try:
+            live = set(self.db.session.scalars(
+                select(Thought.id).where(Thought.id.in_({t for _, t in votes}))))
+            stored = [(p, t) for p, t in votes if t in live and self.reserve_vote(p, t)]
+            totals = {}
+            if stored:
+                self.db.session.execute(insert(Vote.__table__),
+                                        [{"person": p, "thought": t} for p, t in stored])
+                for _, t in stored:
+                    totals[t] = totals.get(t, 0) + 1
+                self.add_thought_vote_totals(totals)
+            self.db.session.commit()
+            self.feed_cache.invalidate(*{thought_tag(t) for _, t in stored})
+            self.events.publish_votes(totals)
+            return True, stored
+        except Exception as e:
+            self.db.session.rollback()
+            return False, str(e)
+
+    
+    def add_thought_vote_totals(self, totals):
+        """Add {thought id: votes} to the thoughts' counters with one executemany"""
+        thoughts = Thought.__table__
+        self.db.session.execute(
+            update(thoughts)
+            .where(thoughts.c.id == bindparam("thought_id"))
+            .values(vote_count=thoughts.c.vote_count + bindparam("delta")),
+            [{"thought_id": t, "delta": n} for t, n in totals.items()],
+        )
+
+    
+    def apply_batch(self, user, operations):
+        """
+        Apply many {"op": "vote" | "delete", "thought": id} operations of
+        `user` in one transaction. Every item is checked before it writes
+        anything, so a refused item is only reported in its result and the
+        others still commit; an unexpected error rolls the whole batch back.
+        """
+        try:
+            results, votes, deleted = [], {}, []
+            for operation in operations:
+                thought_id = operation["thought"]
+                try:
+                    if operation["op"] == "vote":
+                        self.stage_vote(user, thought_id)
+                        votes[thought_id] = votes.get(thought_id, 0) + 1
+                    else:
+                        self.stage_delete(user, thought_id)
+                        votes.pop(thought_id, None)
+                        deleted.append(thought_id)
+                    results.append({"ok": True})
+                except (SecurityException, LookupError) as e:
+                    results.append({"ok": False, "error": str(e)})
+            self.db.session.commit()
+            self.feed_cache.invalidate(*(thought_tag(t) for t in {*votes, *deleted}))
+            self.events.publish_votes(votes)
+            for thought_id in deleted:
+                self.events.publish("delete", thought=thought_id)
+            return True, results
+        except Exception as e:
+            self.db.session.rollback()
+            return False, str(e)
+
+    
+    def stage_vote(self, user, thought_id):
+        """Authorize one vote and write it to the current transaction"""
+        thought = self.db.session.get(Thought, thought_id)
+        if thought is None:
+            raise LookupError("Thought not found")
+        context = {"personalVoteCount": self.get_user_vote_count(user.id, thought.id)}
+        self.cedar.assert_allowed(principal=user, action="voteThought", resource=thought, context=context)
+        if not self.reserve_vote(user.id, thought.id):
+            raise SecurityException("You have reached the maximum number of votes for this thought")
+        self.db.session.add(Vote(person=user.id, thought=thought.id))
+        self.update_thought_vote_count(thought.id, 1)
+
+    
+    def stage_delete(self, user, thought_id):
+        """Authorize one deletion and write it to the current transaction"""
+        thought = self.db.session.get(Thought, thought_id)
+        if thought is None:
+            raise LookupError("Thought not found")
+        self.cedar.assert_allowed(principal=user, action="deleteThought", resource=thought)
+        self.db.session.execute(delete(VoteCounter).where(VoteCounter.thought == thought.id))
+        self.db.session.delete(thought)
+        # Later items of the batch must not find the thought any more
+        self.db.session.flush()
+
+    
     def get_votes_by_thought(self, thought_id):
         try:
             votes = Vote.query.filter_by(thought=thought_id).all()
@@ -246,25 +1147,28 @@ class Domain:
     
     def get_votes_by_user(self, person_id):
         try:
-            votes = Vote.query.filter_by(user=person_id).all()
+            votes = Vote.query.filter_by(person=person_id).all()
             return True, votes
         except Exception as e:
             return False, str(e)
 
     def get_votes_by_thought_user(self, thought_id, person_id):
         try:
-            votes = Vote.query.filter_by(thought=thought_id, user=person_id).all()
+            votes = Vote.query.filter_by(thought=thought_id, person=person_id).all()
             return True, votes
         except Exception as e:
             return False, str(e)
     
     def delete_vote(self, person_id, thought_id):
         try:
-            vote = Vote.query.filter_by(user=person_id, thought=thought_id).first()
+            vote = Vote.query.filter_by(person=person_id, thought=thought_id).first()
             if not vote:
                 return False, "Vote not found"
             self.db.session.delete(vote)
+            self.update_vote_counters(person_id, thought_id, -1)
             self.db.session.commit()
+            self.feed_cache.invalidate(thought_tag(thought_id))
+            self.events.publish("votes", thought=thought_id, delta=-1)
             return True, ""
         except Exception as e:
             self.db.session.rollback()
@@ -277,20 +1181,52 @@ class Domain:
 
     
     
+    def role_registry(self, reload=False):
+        """
+        Role name -> detached Role. Roles are only created by init-db and
+        migrations, so they are read once, in a session of their own.
+        """
+        if self._roles is None or reload:
+            with self._roles_lock:
+                if self._roles is None or reload:
+                    with Session(self.db.engine) as session:
+                        self._roles = {role.name: role for role in session.scalars(select(Role))}
+        return self._roles
+
+    
     def get_role_by_name(self, role_name):
         try:
-            role = Role.query.filter_by(name=role_name).first()
+            role = self.role_registry().get(role_name)
+            if role is None:
+                # Created since the registry was read, e.g. by another process
+                role = self.role_registry(reload=True).get(role_name)
             if role:
-                return True, role
+                return True, self.db.session.merge(role, load=False)
             return False, "Role not found"
         except Exception as e:
             return False, str(e)
 
     
+    def user_roles(self, user_id):
+        """Names of a user's roles, cached until add_role_to_user changes them"""
+        key = roles_tag(user_id)
+        cached = self.role_cache.get(key)
+        if cached is not None:
+            return cached[0]
+        marker = self.role_cache.write_marker()
+        names = frozenset(self.db.session.scalars(
+            select(Role.name).join(UserRoles, UserRoles.role_id == Role.id)
+            .where(UserRoles.user_id == user_id)))
+        self.role_cache.set(key, names, [key, "roles"], marker)
+        return names
+
+    
     def add_role_to_user(self, user : User, role : Role):
         try:
-            user.roles.append(role)
+            self.db.session.add(UserRoles(user_id=user.id, role_id=role.id))
             self.db.session.commit()
+            self.role_cache.invalidate(roles_tag(user.id))
+            self.user_changed(user.id)
             return True, ""
         except Exception as e:
             self.db.session.rollback()
@@ -302,3 +1238,214 @@ class Domain:
         return user.roles == role
 
     
+    def rebuild_user_roles(self):
+        """
+        Migration: `userroles` used to declare user_id and role_id unique on
+        their own, so a role could only ever be held by one user. Rebuild the
+        table with the (user_id, role_id) constraint, keeping existing rows.
+        """
+        try:
+            constraints = inspect(self.db.engine).get_unique_constraints("userroles")
+            if not any(len(c["column_names"]) == 1 for c in constraints):
+                return True, ""
+            self.db.session.execute(text("ALTER TABLE userroles RENAME TO userroles_old"))
+            self.db.session.commit()
+            UserRoles.__table__.create(bind=self.db.engine)
+            self.db.session.execute(text(
+                "INSERT OR IGNORE INTO userroles (id, user_id, role_id) "
+                "SELECT id, user_id, role_id FROM userroles_old"
+            ))
+            self.db.session.execute(text("DROP TABLE userroles_old"))
+            self.db.session.commit()
+            self.role_cache.invalidate("roles")
+            return True, ""
+        except Exception as e:
+            self.db.session.rollback()
+            return False, str(e)
+
+    
+    def bulk_chunk_size(self, chunk_size=None):
+        return chunk_size or self.config.get('BULK_CHUNK_SIZE', BULK_CHUNK_SIZE)
+
+    
+    def bulk_committed(self):
+        """Chunks are written with Core statements: refresh what caches derived from them"""
+        self.feed_cache.invalidate(FEED_TAG)
+        self._leaderboard.invalidate()
+        self._entities_changed()
+
+    
+    def import_users(self, records, chunk_size=None, hash_passwords=False):
+        """
+        Insert users in chunked transactions, one executemany per table. Records
+        carry username, password (a hash unless `hash_passwords`), optionally
+        active and roles (BASE_USER when absent). Existing usernames, duplicates
+        and records naming unknown roles are skipped.
+        """
+        stats = {"inserted": 0, "skipped": 0}
+        try:
+            role_ids = dict(self.db.session.execute(select(Role.name, Role.id)).all())
+            for chunk in chunked(records, self.bulk_chunk_size(chunk_size)):
+                names = [str(r.get("username", "")) for r in chunk]
+                # usernames compare case-insensitively (NOCASE collation)
+                seen = {n.lower() for n in self.db.session.scalars(
+                    select(User.username).where(User.username.in_(names)))}
+                users, roles = [], {}
+                for record, name in zip(chunk, names):
+                    wanted = as_list(record.get("roles")) or [BASE_USER]
+                    if not name or not record.get("password") or name.lower() in seen \
+                            or any(role not in role_ids for role in wanted):
+                        stats["skipped"] += 1
+                        continue
+                    seen.add(name.lower())
+                    password = record["password"]
+                    if hash_passwords:
+                        password = self.user_manager.password_manager.hash_password(password)
+                    active = record.get("active", True)
+                    if isinstance(active, str):
+                        active = active.lower() in ("1", "true", "yes")
+                    users.append({"username": name, "password": password, "active": bool(active)})
+                    roles[name.lower()] = wanted
+                if users:
+                    self.db.session.execute(insert(User), users)
+                    ids = self.db.session.execute(select(User.id, User.username).where(
+                        User.username.in_([u["username"] for u in users]))).all()
+                    self.db.session.execute(insert(UserRoles), [
+                        {"user_id": user_id, "role_id": role_ids[role]}
+                        for user_id, name in ids for role in roles[name.lower()]
+                    ])
+                self.db.session.commit()
+                stats["inserted"] += len(users)
+            self.bulk_committed()
+            return True, stats
+        except Exception as e:
+            self.db.session.rollback()
+            self.bulk_committed()
+            return False, f"{e} (after {stats['inserted']} users were imported)"
+
+    
+    def import_thoughts(self, records, chunk_size=None):
+        """
+        Insert thoughts in chunked transactions. Records carry content and the
+        creator's username; an `id` is kept when given, so that imported votes
+        can refer to it, and so is `created_at` (else the import time). Unknown
+        creators, taken or unreadable ids and unreadable times are skipped.
+        """
+        stats = {"inserted": 0, "skipped": 0}
+        try:
+            stmt = sqlite_insert(Thought.__table__).on_conflict_do_nothing(index_elements=["id"])
+            for chunk in chunked(records, self.bulk_chunk_size(chunk_size)):
+                user_ids = self.user_ids([r.get("username") for r in chunk])
+                thoughts = []
+                for record in chunk:
+                    user_id = user_ids.get(str(record.get("username", "")).lower())
+                    if user_id is None or not record.get("content"):
+                        continue
+                    try:
+                        created_at = as_datetime(record.get("created_at")) or utcnow()
+                        # A NULL id makes SQLite assign the next rowid
+                        thought_id = int(record["id"]) if record.get("id") else None
+                    except (TypeError, ValueError):
+                        continue
+                    thoughts.append({"id": thought_id,
+                                     "content": record["content"], "user": user_id, "vote_count": 0,
+                                     "created_at": created_at})
+                inserted = self.db.session.execute(stmt, thoughts).rowcount if thoughts else 0
+                self.db.session.commit()
+                stats["inserted"] += inserted
+                stats["skipped"] += len(chunk) - inserted
+            self.bulk_committed()
+            return True, stats
+        except Exception as e:
+            self.db.session.rollback()
+            self.bulk_committed()
+            return False, f"{e} (after {stats['inserted']} thoughts were imported)"
+
+    
+    def import_votes(self, records, chunk_size=None):
+        """
+        Insert votes in chunked transactions, keeping both denormalized counters
+        in step. The rules the application enforces still hold: votes on
+        unknown thoughts, on one's own thoughts and past VOTE_LIMIT are skipped.
+        """
+        stats = {"inserted": 0, "skipped": 0}
+        try:
+            counters = sqlite_insert(VoteCounter.__table__)
+            counters = counters.on_conflict_do_update(
+                index_elements=["person", "thought"],
+                set_={"count": VoteCounter.__table__.c.count + counters.excluded.count},
+            )
+            for chunk in chunked(records, self.bulk_chunk_size(chunk_size)):
+                user_ids = self.user_ids([r.get("username") for r in chunk])
+                thought_ids = {int(r["thought"]) for r in chunk if str(r.get("thought", "")).isdigit()}
+                creators = dict(self.db.session.execute(
+                    select(Thought.id, Thought.user).where(Thought.id.in_(thought_ids))).all())
+                counts = {(p, t): c for p, t, c in self.db.session.execute(
+                    select(VoteCounter.person, VoteCounter.thought, VoteCounter.count)
+                    .where(VoteCounter.person.in_(user_ids.values()), VoteCounter.thought.in_(creators))
+                ).all()}
+                votes, pairs, totals = [], {}, {}
+                for record in chunk:
+                    person = user_ids.get(str(record.get("username", "")).lower())
+                    thought = str(record.get("thought", ""))
+                    thought = int(thought) if thought.isdigit() else None
+                    if person is None or thought not in creators or creators[thought] == person \
+                            or counts.get((person, thought), 0) >= VOTE_LIMIT:
+                        continue
+                    counts[(person, thought)] = counts.get((person, thought), 0) + 1
+                    pairs[(person, thought)] = pairs.get((person, thought), 0) + 1
+                    totals[thought] = totals.get(thought, 0) + 1
+                    votes.append({"person": person, "thought": thought})
+                if votes:
+                    self.db.session.execute(insert(Vote.__table__), votes)
+                    self.db.session.execute(counters, [
+                        {"person": p, "thought": t, "count": n} for (p, t), n in pairs.items()])
+                    self.add_thought_vote_totals(totals)
+                self.db.session.commit()
+                stats["inserted"] += len(votes)
+                stats["skipped"] += len(chunk) - len(votes)
+            self.bulk_committed()
+            return True, stats
+        except Exception as e:
+            self.db.session.rollback()
+            self.bulk_committed()
+            return False, f"{e} (after {stats['inserted']} votes were imported)"
+
+    
+    def user_ids(self, usernames):
+        """Lower-cased username -> id for the given names, in one query"""
+        names = {str(n) for n in usernames if n}
+        if not names:
+            return {}
+        return {name.lower(): user_id for user_id, name in self.db.session.execute(
+            select(User.id, User.username).where(User.username.in_(names))).all()}
+
+    
+    def export_records(self, kind):
+        """
+        Fields and a lazy iterator of records, read through a streaming cursor
+        in batches so no table is ever loaded whole.
+        """
+        try:
+            if kind == "users":
+                roles = select(func.group_concat(Role.name, ";")) \
+                    .join(UserRoles, UserRoles.role_id == Role.id) \
+                    .where(UserRoles.user_id == User.id).scalar_subquery()
+                stmt = select(User.username, User.password, User.active, roles.label("roles")).order_by(User.id)
+                convert = lambda r: {"username": r.username, "password": r.password,
+                                     "active": r.active, "roles": as_list(r.roles)}
+            elif kind == "thoughts":
+                stmt = select(Thought.id, User.username, Thought.content, Thought.created_at) \
+                    .join(User, User.id == Thought.user).order_by(Thought.id)
+                convert = lambda r: {"id": r.id, "username": r.username, "content": r.content,
+                                     "created_at": r.created_at.isoformat() if r.created_at else None}
+            elif kind == "votes":
+                stmt = select(User.username, Vote.thought) \
+                    .join(User, User.id == Vote.person).where(Vote.thought.is_not(None)).order_by(Vote.id)
+                convert = lambda r: {"username": r.username, "thought": r.thought}
+            else:
+                return False, f"Unknown kind {kind}"
+            rows = self.db.session.execute(stmt.execution_options(yield_per=1000))
+            return True, (EXPORT_FIELDS[kind], (convert(row) for row in rows))
+        except Exception as e:
+            return False, str(e)
@@ -0,0 +1,117 @@
+from itertools import count
+from threading import Condition, Lock
+
+RESET = {"type": "reset"}
+
+
+class Subscription:
+    """
+    One listener's bounded buffer. Vote deltas for a thought still waiting
+    to be sent are summed into a single event, so a burst of votes costs a
+    slow client one message. A client that falls `maxsize` events behind
+    loses its buffer and gets a single "reset" event instead.
+    """
+
+    def __init__(self, hub, maxsize):
+        self.hub = hub
+        self.maxsize = maxsize
+        self.overflowed = False
+        # Insertion ordered: ("votes", thought) keys coalesce, others are unique
+        self._pending: dict = {}
+        self._sequence = count()
+        self._cond = Condition(Lock())
+
+    def push(self, event):
+        with self._cond:
+            if self.overflowed:
+                return
+            if event["type"] == "votes":
+                key = ("votes", event["thought"])
+                queued = self._pending.get(key)
+                if queued is not None:
+                    self._pending[key] = {**queued, "delta": queued["delta"] + event["delta"]}
+                    return
+            else:
+                if event["type"] == "delete":
+                    self._pending.pop(("votes", event["thought"]), None)
+                key = next(self._sequence)
+            if len(self._pending) >= self.maxsize:
+                self._pending.clear()
+                self.overflowed = True
+            else:
+                self._pending[key] = event
+            self._cond.notify()
+
+    def wait(self, timeout):
+        """Every event pending, waiting up to `timeout` seconds for one"""
+        with self._cond:
+            if not self._pending and not self.overflowed:
+                self._cond.wait(timeout)
+            if self.overflowed:
+                self.overflowed = False
+                return [RESET]
+            events = [e for e in self._pending.values() if e["type"] != "votes" or e["delta"]]
+            self._pending.clear()
+            return events
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class EventHub:
+    """
+    In-process broadcast of feed changes to Server-Sent Events streams and
+    to listeners, callables run synchronously by `publish` (keep them
+    cheap). Publishing never blocks on a stream. Each process only sees
+    its own writes: with several workers a client follows the changes made
+    through the worker that serves its stream.
+    """
+
+    def __init__(self, buffer_size: int = 256, max_subscribers: int | None = None):
+        self.buffer_size = buffer_size
+        self.max_subscribers = max_subscribers
+        self._lock = Lock()
+        # Replaced, never mutated, so publish can iterate it without the lock
+        self._subscribers: tuple = ()
+        self._listeners: tuple = ()
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def subscribe(self) -> Subscription | None:
+        """A new subscription, or None when `max_subscribers` are listening"""
+        with self._lock:
+            if self.max_subscribers is not None and len(self._subscribers) >= self.max_subscribers:
+                return None
+            subscription = Subscription(self, self.buffer_size)
+            self._subscribers = self._subscribers + (subscription,)
+            return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers = tuple(s for s in self._subscribers if s is not subscription)
+
+    def add_listener(self, listener):
+        with self._lock:
+            self._listeners = self._listeners + (listener,)
+
+    def publish(self, type: str, **data):
+        subscribers, listeners = self._subscribers, self._listeners
+        if not subscribers and not listeners:
+            return
+        event = {"type": type, **data}
+        for listener in listeners:
+            listener(event)
+        for subscription in subscribers:
+            subscription.push(event)
+
+    def publish_votes(self, totals: dict[int, int]):
+        """Publish {thought id: vote delta}"""
+        for thought_id, delta in totals.items():
+            self.publish("votes", thought=thought_id, delta=delta)
@@ -0,0 +1,20 @@
+# gunicorn settings for the production entry point, see wsgi.py
+# Every value can be overridden from the environment.
+import multiprocessing
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+# Threaded workers keep requests waiting on SQLite or Cedar from blocking the whole process
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+keepalive = 5
+# create_app() opens no database connection and parses no policy, so the app can
+# be imported once in the master and forked into workers that start instantly
+preload_app = True
+# Recycle workers now and then so slow leaks cannot accumulate
+max_requests = 2000
+max_requests_jitter = 200
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG", "-")
+loglevel = os.environ.get("GUNICORN_LOG_LEVEL", "info")
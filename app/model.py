@@ -1,11 +1,14 @@
 
+from datetime import datetime, timezone
 from enum import Enum, auto
-from app import db
+from flask_sqlalchemy import SQLAlchemy
 from flask_user import UserMixin
+from sqlalchemy import DDL, event
 # from sqlalchemy.types import TypeDecorator
 # from cryptography.fernet import Fernet
 
-# Create a base db instance for model definitions
+# Create a base db instance for model definitions, bound to the app by create_app()
+db = SQLAlchemy()
 
 # ENCRYPTION_KEY = Fernet.generate_key()
 # fernet = Fernet(ENCRYPTION_KEY)
@@ -25,6 +28,11 @@ from flask_user import UserMixin
 #         return value
 
 
+def utcnow():
+    """Naive UTC, as SQLite stores DATETIME columns without a zone"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
 BASE_USER = "baseuser"
 OTHER = "other"
 
@@ -46,27 +54,73 @@ class Role(db.Model):
 
 class UserRoles(db.Model):
     __tablename__ = 'userroles'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'role_id', name='uq_userroles_user_role'),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, unique=True)
-    role_id = db.Column(db.Integer, db.ForeignKey('roles.id'), nullable=False, unique=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    role_id = db.Column(db.Integer, db.ForeignKey('roles.id'), nullable=False)
 
 class Thought(db.Model):
 
     __tablename__ = 'thoughts'
+    __table_args__ = (
+        # A user's timeline: a page is picked from this index alone, then
+        # its contents are read by primary key. The leading column also
+        # serves lookups by `user`
+        db.Index('ix_thoughts_user_timeline', 'user', 'id', 'created_at'),
+    )
     
     id = db.Column(db.Integer , primary_key=True)
-    content = db.Column(db.String (500), nullable=False, index=True)
-    user = db.Column(db.Integer , db.ForeignKey('users.id'), index=True)
+    content = db.Column(db.String (500), nullable=False)
+    user = db.Column(db.Integer , db.ForeignKey('users.id'))
+    vote_count = db.Column(db.Integer, nullable=False, server_default='0', default=0)
+    # NULL for thoughts written before the column existed
+    created_at = db.Column(db.DateTime, default=utcnow)
     votedBy = db.relationship('Vote', backref='votee')
 
+# Full-text index over thought content. The FTS5 table stores no text of its
+# own (external content) and the triggers keep it in step with `thoughts`
+THOUGHTS_FTS_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS thoughts_fts USING fts5(
+        content, content='thoughts', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2')""",
+    """CREATE TRIGGER IF NOT EXISTS thoughts_fts_insert AFTER INSERT ON thoughts BEGIN
+        INSERT INTO thoughts_fts(rowid, content) VALUES (new.id, new.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS thoughts_fts_delete AFTER DELETE ON thoughts BEGIN
+        INSERT INTO thoughts_fts(thoughts_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS thoughts_fts_update AFTER UPDATE OF content ON thoughts BEGIN
+        INSERT INTO thoughts_fts(thoughts_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO thoughts_fts(rowid, content) VALUES (new.id, new.content);
+    END""",
+]
+
+for statement in THOUGHTS_FTS_DDL:
+    event.listen(Thought.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+
 class Vote(db.Model):
     
     __tablename__ = 'votes'
+    __table_args__ = (
+        db.Index('ix_votes_thought_person', 'thought', 'person'),
+        db.Index('ix_votes_person', 'person'),
+    )
     
     id = db.Column(db.Integer , primary_key =True)
     person = db.Column(db.Integer , db.ForeignKey('users.id'))
     thought = db.Column(db.Integer , db.ForeignKey('thoughts.id'))
 
+class VoteCounter(db.Model):
+    """Denormalized number of votes a user cast on a thought, kept in step with `votes`"""
+
+    __tablename__ = 'vote_counters'
+
+    person = db.Column(db.Integer , db.ForeignKey('users.id'), primary_key=True)
+    thought = db.Column(db.Integer , db.ForeignKey('thoughts.id'), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, server_default='0', default=0)
+
 
     # @staticmethod
     # def check_user_existence(usr, pwd=None):
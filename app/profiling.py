@@ -0,0 +1,148 @@
+"""
+Per-request instrumentation: query count, SQL, Cedar and template time sent
+as a Server-Timing header, a slow query log with SQLite query plans, and
+cProfile dumps of requests that ask for one with an `X-Profile` header
+carrying PROFILE_TOKEN.
+"""
+import cProfile
+import hmac
+import logging
+import os
+import random
+import sqlite3
+import time
+from time import perf_counter
+
+from flask import before_render_template, g, has_request_context, request, template_rendered
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "X-Profile"
+
+
+class RequestTiming:
+    """What one request spent, filled in by the hooks below"""
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.queries = 0
+        self.sql = 0.0
+        self.template = 0.0
+        self._template_depth = 0
+        self._template_started = 0.0
+
+    @staticmethod
+    def current() -> "RequestTiming | None":
+        return g.get("request_timing") if has_request_context() else None
+
+    def server_timing(self) -> str:
+        total = perf_counter() - self.started
+        cedar = g.get("cedar_seconds", 0.0)
+        return ", ".join([
+            f'db;dur={self.sql * 1000:.2f};desc="{self.queries} queries"',
+            f"cedar;dur={cedar * 1000:.2f}",
+            f"tpl;dur={self.template * 1000:.2f}",
+            f"total;dur={total * 1000:.2f}",
+        ])
+
+
+def init_profiling(app, engine):
+    """Install the request, SQLAlchemy and template hooks on `app` and its engine"""
+    slow_query_ms = app.config.get('SLOW_QUERY_MS')
+
+    # The start time lives on the statement's execution context: a statement
+    # that raises takes it along instead of leaving it to the next one
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context.query_started = perf_counter()
+
+    def query_finished(context):
+        started = getattr(context, "query_started", None)
+        if started is None:
+            return None
+        context.query_started = None
+        elapsed = perf_counter() - started
+        timing = RequestTiming.current()
+        if timing is not None:
+            timing.queries += 1
+            timing.sql += elapsed
+        return elapsed
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = query_finished(context)
+        if elapsed is not None and slow_query_ms is not None and elapsed * 1000 >= slow_query_ms:
+            log_slow_query(conn, cursor, statement, parameters, executemany, elapsed)
+
+    def handle_error(exception_context):
+        query_finished(exception_context.execution_context)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(engine, "handle_error", handle_error)
+
+    def template_started(sender, template, context, **extra):
+        timing = RequestTiming.current()
+        if timing is not None:
+            # Partials render inside their page: only time the outermost template
+            if timing._template_depth == 0:
+                timing._template_started = perf_counter()
+            timing._template_depth += 1
+
+    def template_finished(sender, template, context, **extra):
+        timing = RequestTiming.current()
+        if timing is not None and timing._template_depth:
+            timing._template_depth -= 1
+            if timing._template_depth == 0:
+                timing.template += perf_counter() - timing._template_started
+
+    before_render_template.connect(template_started, app, weak=False)
+    template_rendered.connect(template_finished, app, weak=False)
+
+    @app.before_request
+    def start_request_timing():
+        g.request_timing = RequestTiming()
+        profile_dir = app.config.get('PROFILE_DIR')
+        token = app.config.get('PROFILE_TOKEN')
+        # Every dump is a file: only clients holding the token may ask for one
+        if profile_dir and token \
+                and hmac.compare_digest(request.headers.get(PROFILE_HEADER, "").encode(), token.encode()) \
+                and random.random() < app.config.get('PROFILE_SAMPLE_RATE', 1.0):
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another request of this process is being profiled
+                return
+            g.profiler = profiler
+
+    @app.after_request
+    def finish_request_timing(response):
+        profiler = g.pop("profiler", None)
+        if profiler is not None:
+            profiler.disable()
+            dump_profile(profiler, app.config['PROFILE_DIR'])
+        timing = g.get("request_timing")
+        if timing is not None and app.config.get('SERVER_TIMING', True):
+            response.headers["Server-Timing"] = timing.server_timing()
+        return response
+
+
+def log_slow_query(conn, cursor, statement, parameters, executemany, elapsed):
+    plan = ""
+    if conn.dialect.name == "sqlite" and not executemany \
+            and not statement.lstrip().upper().startswith(("EXPLAIN", "PRAGMA")):
+        try:
+            rows = cursor.connection.execute("EXPLAIN QUERY PLAN " + statement, parameters).fetchall()
+            plan = "".join(f"\n    {row[-1]}" for row in rows)
+        except sqlite3.Error as e:
+            plan = f"\n    (no query plan: {e})"
+    logger.warning("Slow query (%.1f ms): %s%s", elapsed * 1000, " ".join(statement.split()), plan)
+
+
+def dump_profile(profiler, profile_dir):
+    os.makedirs(profile_dir, exist_ok=True)
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{request.endpoint}-{os.getpid()}-{random.randrange(1 << 16):04x}.prof"
+    path = os.path.join(profile_dir, name)
+    profiler.dump_stats(path)
+    logger.info("Profile of %s written to %s", request.path, path)
@@ -0,0 +1,59 @@
+import pytest
+
+from app import create_app
+
+PASSWORD = "Password1"
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """create_app on a fresh SQLite database, initialised like `flask init-db`"""
+    apps = []
+
+    def make(**config):
+        app = create_app({
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path}/test.db",
+            "SECRET_KEY": "test-" + "x" * 32,
+            "WTF_CSRF_ENABLED": False,
+            "LOG_LEVEL": "WARNING",
+            "JINJA_BYTECODE_CACHE": False,
+            **config,
+        })
+        with app.app_context():
+            s, errmsg = app.extensions['domain'].initialise_database()
+        assert s, errmsg
+        apps.append(app)
+        return app
+
+    yield make
+    for app in apps:
+        queue = app.extensions['domain']._vote_queue
+        if queue is not None:
+            queue.close()
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+
+@pytest.fixture
+def seed():
+    """Users named user00.. (password PASSWORD) and thoughts 1.. round-robin over them"""
+
+    def seed(app, users, thoughts=0):
+        domain = app.extensions['domain']
+        names = [f"user{i:02d}" for i in range(users)]
+        with app.app_context():
+            password = domain.user_manager.password_manager.hash_password(PASSWORD)
+            checks = [
+                domain.import_users({"username": name, "password": password} for name in names),
+                domain.import_thoughts({"id": t, "username": names[(t - 1) % users],
+                                        "content": f"thought {t}"}
+                                       for t in range(1, thoughts + 1)),
+            ]
+        for s, rs in checks:
+            assert s, rs
+        return names
+
+    return seed
@@ -0,0 +1,73 @@
+import pytest
+
+from conftest import PASSWORD
+from domain import VOTE_LIMIT
+
+JSON = {"Content-Type": "application/json"}
+
+
+@pytest.fixture
+def client(app, seed):
+    # Thought 1 belongs to user00, the client is user01
+    seed(app, users=2, thoughts=1)
+    client = app.test_client()
+    client.post("/user/sign-in", data={"username": "user01", "password": PASSWORD})
+    return client
+
+
+@pytest.mark.parametrize("method, path", [
+    ("POST", "/api/v1/thoughts/1/votes"),
+    ("DELETE", "/api/v1/thoughts/1"),
+    ("POST", "/api/v1/thoughts"),
+])
+def test_writes_without_a_json_content_type_are_refused(client, method, path):
+    # What a cross-site HTML form can send along with the session cookie
+    response = client.open(path, method=method, data={"content": "forged"})
+    assert response.status_code == 415
+    assert client.get("/api/v1/thoughts/1").get_json()["votes"] == 0
+
+
+def test_vote_with_a_json_content_type(client):
+    response = client.post("/api/v1/thoughts/1/votes", headers=JSON)
+    assert response.status_code == 201
+    assert response.get_json() == {"thought": 1, "votes": 1}
+
+
+def test_update_of_a_missing_thought_is_404(app, seed):
+    seed(app, users=1)
+    client = app.test_client()
+    client.post("/user/sign-in", data={"username": "user00", "password": PASSWORD})
+    assert client.patch("/api/v1/thoughts/99", json={"content": "new"}).status_code == 404
+
+
+def test_update_database_error_is_500(app, seed, monkeypatch):
+    seed(app, users=1, thoughts=1)
+    client = app.test_client()
+    client.post("/user/sign-in", data={"username": "user00", "password": PASSWORD})
+    monkeypatch.setattr(app.extensions['domain'], "update_thought",
+                        lambda *args, **kwargs: (False, "database is locked"))
+    response = client.patch("/api/v1/thoughts/1", json={"content": "new"})
+    assert response.status_code == 500
+    assert response.get_json() == {"error": "database is locked"}
+
+
+def test_vote_refusals_are_403(client):
+    for _ in range(VOTE_LIMIT):
+        assert client.post("/api/v1/thoughts/1/votes", headers=JSON).status_code == 201
+    response = client.post("/api/v1/thoughts/1/votes", headers=JSON)
+    assert response.status_code == 403
+    assert client.get("/api/v1/thoughts/1").get_json()["votes"] == VOTE_LIMIT
+
+
+def test_vote_on_a_missing_thought_is_404(client):
+    assert client.post("/api/v1/thoughts/99/votes", headers=JSON).status_code == 404
+
+
+def test_vote_database_error_is_500(app, client, monkeypatch):
+    def fail(*args):
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(app.extensions['domain'], "get_user_vote_count", fail)
+    response = client.post("/api/v1/thoughts/1/votes", headers=JSON)
+    assert response.status_code == 500
+    assert response.get_json() == {"error": "database is locked"}
@@ -0,0 +1,47 @@
+import io
+from datetime import datetime
+
+import pytest
+
+from utilities.bulk import FORMATS, read_records, write_records
+
+
+@pytest.mark.parametrize("fmt", FORMATS)
+def test_thoughts_keep_their_creation_time_through_export_and_import(make_app, tmp_path, fmt):
+    source = make_app(SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path}/source.db")
+    target = make_app(SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path}/target.db")
+    users = [{"username": "user00", "password": "x"}]
+    thoughts = [{"id": 1, "username": "user00", "content": "first", "created_at": "2020-01-02T03:04:05"},
+                {"id": 2, "username": "user00", "content": "second", "created_at": "2021-06-07T08:09:10+02:00"}]
+    with source.app_context():
+        domain = source.extensions['domain']
+        assert domain.import_users(users)[0]
+        assert domain.import_thoughts(thoughts)[0]
+        s, (fields, records) = domain.export_records("thoughts")
+        assert s
+        stream = io.StringIO()
+        write_records(stream, fmt, fields, records)
+    stream.seek(0)
+    with target.app_context():
+        domain = target.extensions['domain']
+        assert domain.import_users(users)[0]
+        assert domain.import_thoughts(read_records(stream, fmt)) == (True, {"inserted": 2, "skipped": 0})
+        s, page = domain.get_user_timeline(domain.get_user_by_username("user00")[1].id)
+    assert s
+    assert [(row.id, row.created_at) for row in page.items] == [
+        (2, datetime(2021, 6, 7, 6, 9, 10)),
+        (1, datetime(2020, 1, 2, 3, 4, 5)),
+    ]
+
+
+def test_thoughts_with_unreadable_fields_are_skipped(app):
+    with app.app_context():
+        domain = app.extensions['domain']
+        assert domain.import_users([{"username": "user00", "password": "x"}])[0]
+        result = domain.import_thoughts([
+            {"id": "seven", "username": "user00", "content": "bad id"},
+            {"id": [1], "username": "user00", "content": "bad id"},
+            {"id": 2, "username": "user00", "content": "bad time", "created_at": "yesterday"},
+            {"id": 3, "username": "user00", "content": "fine"},
+        ])
+    assert result == (True, {"inserted": 1, "skipped": 3})
@@ -0,0 +1,22 @@
+from utilities.cache import MemoryBackend, TaggedCache
+
+
+def test_tag_counters_are_bounded():
+    cache = TaggedCache(MemoryBackend(maxsize=4, counter_maxsize=10))
+    for i in range(1000):
+        cache.invalidate(f"thought:{i}")
+    assert len(cache.backend._counters) == 10
+
+
+def test_invalidated_entry_stays_invalid_after_its_counter_is_evicted():
+    cache = TaggedCache(MemoryBackend(maxsize=4, counter_maxsize=3))
+    cache.set("page", "old", ["thought:1"], cache.write_marker())
+    cache.invalidate("thought:1")
+    # Push the tag's counter out of the LRU
+    for i in range(2, 10):
+        cache.invalidate(f"thought:{i}")
+    assert "tag:thought:1" not in cache.backend._counters
+    assert cache.get("page") is None
+
+    cache.set("page", "new", ["thought:1"], cache.write_marker())
+    assert cache.get("page")[0] == "new"
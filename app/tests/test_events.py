@@ -0,0 +1,60 @@
+from events import RESET, EventHub
+
+
+def test_vote_deltas_for_a_thought_are_merged():
+    hub = EventHub()
+    with hub.subscribe() as subscription:
+        hub.publish_votes({1: 1})
+        hub.publish("thought", id=3, content="new")
+        hub.publish_votes({1: 2, 2: 1})
+        hub.publish_votes({2: -1})
+        assert subscription.wait(0) == [
+            {"type": "votes", "thought": 1, "delta": 3},
+            {"type": "thought", "id": 3, "content": "new"},
+        ]
+        assert subscription.wait(0) == []
+
+
+def test_delete_drops_the_thoughts_pending_votes():
+    hub = EventHub()
+    with hub.subscribe() as subscription:
+        hub.publish_votes({1: 1, 2: 1})
+        hub.publish("delete", thought=1)
+        assert subscription.wait(0) == [
+            {"type": "votes", "thought": 2, "delta": 1},
+            {"type": "delete", "thought": 1},
+        ]
+
+
+def test_overflow_sends_a_single_reset():
+    hub = EventHub(buffer_size=3)
+    with hub.subscribe() as subscription:
+        for thought in range(10):
+            hub.publish("delete", thought=thought)
+        assert subscription.wait(0) == [RESET]
+        hub.publish("delete", thought=42)
+        assert subscription.wait(0) == [{"type": "delete", "thought": 42}]
+
+
+def test_subscribers_are_capped():
+    hub = EventHub(max_subscribers=2)
+    first, second = hub.subscribe(), hub.subscribe()
+    assert hub.subscribe() is None
+    first.close()
+    assert hub.subscribe() is not None
+    assert len(hub) == 2
+    second.close()
+
+
+def test_events_stream_refuses_listeners_past_the_limit(make_app):
+    client = make_app(EVENTS_MAX_SUBSCRIBERS=1).test_client()
+    stream = client.get("/events")
+    assert stream.status_code == 200
+    assert stream.mimetype == "text/event-stream"
+    refused = client.get("/events")
+    assert refused.status_code == 503
+    assert refused.headers["Retry-After"] == "60"
+    stream.close()
+    again = client.get("/events")
+    assert again.status_code == 200
+    again.close()
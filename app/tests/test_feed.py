@@ -0,0 +1,68 @@
+import re
+
+import pytest
+
+from conftest import PASSWORD
+
+QUERIES = re.compile(r'db;dur=[\d.]+;desc="(\d+) queries"')
+
+
+def query_count(response):
+    assert response.status_code == 200
+    return int(QUERIES.search(response.headers["Server-Timing"]).group(1))
+
+
+@pytest.mark.parametrize("signed_in", [False, True])
+def test_feed_page_query_count_does_not_grow_with_the_page(make_app, seed, signed_in):
+    # Render every page in full: a streamed page runs queries after the header is set
+    app = make_app(FEED_STREAM_MIN_SIZE=1000)
+    seed(app, users=5, thoughts=150)
+    client = app.test_client()
+    if signed_in:
+        client.post("/user/sign-in", data={"username": "user00", "password": PASSWORD})
+        assert client.get("/memberpage").status_code == 200
+    # Warm the per-user caches so both measured pages start from the same state
+    query_count(client.get("/?size=5"))
+
+    small = query_count(client.get("/?size=20"))
+    large = query_count(client.get("/?size=100"))
+
+    assert small > 0
+    assert small == large
+
+
+@pytest.mark.parametrize("through", ["domain", "flask-user"])
+def test_feed_shows_a_changed_username(make_app, seed, through):
+    app = make_app()
+    seed(app, users=2, thoughts=4)
+    client = app.test_client()
+    client.post("/user/sign-in", data={"username": "user01", "password": PASSWORD})
+    assert "<td>user00</td>" in client.get("/").get_data(as_text=True)
+
+    if through == "domain":
+        with app.app_context():
+            domain = app.extensions['domain']
+            user = domain.get_user_by_username("user00")[1]
+            assert domain.update_user(user.id, {"username": "renamed"})[0]
+    else:
+        renamer = app.test_client()
+        renamer.post("/user/sign-in", data={"username": "user00", "password": PASSWORD})
+        renamer.post("/user/change-username", data={"new_username": "renamed", "old_password": PASSWORD})
+
+    body = client.get("/").get_data(as_text=True)
+    assert "<td>user00</td>" not in body
+    assert body.count("<td>renamed</td>") == 2
+
+
+def test_feed_revalidates_with_etag_or_last_modified(make_app, seed):
+    app = make_app()
+    seed(app, users=1, thoughts=3)
+    client = app.test_client()
+    first = client.get("/")
+    assert first.status_code == 200
+
+    assert client.get("/", headers={"If-None-Match": first.headers["ETag"]}).status_code == 304
+    since = {"If-Modified-Since": first.headers["Last-Modified"]}
+    assert client.get("/", headers=since).status_code == 304
+    # A stale ETag wins over a matching date
+    assert client.get("/", headers={**since, "If-None-Match": '"stale"'}).status_code == 200
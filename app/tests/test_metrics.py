@@ -0,0 +1,11 @@
+def test_metrics_are_hidden_without_a_token(app):
+    assert app.test_client().get("/metrics").status_code == 404
+
+
+def test_metrics_need_the_token(make_app):
+    client = make_app(METRICS_TOKEN="scrape-me").test_client()
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    response = client.get("/metrics", headers={"Authorization": "Bearer scrape-me"})
+    assert response.status_code == 200
+    assert "cedar_decision_cache_misses_total" in response.get_data(as_text=True)
@@ -0,0 +1,33 @@
+import re
+
+from sqlalchemy import event
+
+from conftest import PASSWORD
+
+QUERIES = re.compile(r'db;dur=[\d.]+;desc="(\d+) queries"')
+
+
+def test_signed_in_requests_do_not_query_the_user(app, seed):
+    seed(app, users=2, thoughts=4)
+    client = app.test_client()
+    client.post("/user/sign-in", data={"username": "user00", "password": PASSWORD})
+    # The first request after signing in loads the principal into the cache
+    assert client.get("/memberpage").status_code == 200
+
+    statements = []
+    with app.app_context():
+        engine = app.extensions['domain'].db.engine
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        responses = [client.get(path) for path in ("/memberpage", "/api/v1/thoughts/1", "/memberpage")]
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+    assert [r.status_code for r in responses] == [200, 200, 200]
+    # The member page only reads the timeline
+    assert int(QUERIES.search(responses[0].headers["Server-Timing"]).group(1)) == 1
+    assert not [s for s in statements if re.search(r"\bFROM (users|roles|userroles)\b", s)]
@@ -0,0 +1,44 @@
+import time
+
+import pytest
+from flask import g
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from config import ProductionConfig
+from profiling import RequestTiming
+
+
+def test_failed_statement_is_timed_once(app):
+    domain = app.extensions['domain']
+    with app.test_request_context():
+        g.request_timing = timing = RequestTiming()
+        with pytest.raises(OperationalError):
+            domain.db.session.execute(text("SELECT * FROM no_such_table"))
+        domain.db.session.rollback()
+        assert timing.queries == 1
+        time.sleep(0.2)
+        domain.db.session.execute(text("SELECT 1"))
+        assert timing.queries == 2
+        assert timing.sql < 0.1
+
+
+def test_profiles_are_only_dumped_for_the_token(make_app, tmp_path):
+    profiles = tmp_path / "profiles"
+    client = make_app(PROFILE_DIR=str(profiles), PROFILE_TOKEN="profile-me").test_client()
+    client.get("/", headers={"X-Profile": "1"})
+    client.get("/", headers={"X-Profile": "wrong"})
+    assert not profiles.exists()
+    client.get("/", headers={"X-Profile": "profile-me"})
+    assert len(list(profiles.iterdir())) == 1
+
+
+def test_no_profiles_without_a_token(make_app, tmp_path):
+    profiles = tmp_path / "profiles"
+    make_app(PROFILE_DIR=str(profiles)).test_client().get("/", headers={"X-Profile": "1"})
+    assert not profiles.exists()
+
+
+def test_production_sends_no_server_timing(make_app):
+    app = make_app(SERVER_TIMING=ProductionConfig.SERVER_TIMING)
+    assert "Server-Timing" not in app.test_client().get("/").headers
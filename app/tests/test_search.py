@@ -0,0 +1,70 @@
+import pytest
+
+from domain import match_expression
+from model import User
+
+
+def test_match_expression_quotes_every_word():
+    assert match_expression('say "hi" OR NOT col:x NEAR(a b) pre*') == \
+        '"say" """hi""" "OR" "NOT" "col:x" "NEAR(a" "b)" "pre"*'
+    assert match_expression("* ** ") == ""
+
+
+@pytest.mark.parametrize("query", ['"', 'apple"', 'OR', 'apple AND', 'NEAR(apple', 'content:apple',
+                                   '-apple', '^apple', 'apple)', "a'b"])
+def test_fts_syntax_in_the_query_is_searched_as_text(app, seed, query):
+    seed(app, users=1, thoughts=3)
+    with app.app_context():
+        s, page = app.extensions['domain'].search_thoughts(query)
+    assert s, page
+    assert page.items == []
+
+
+def test_search_pages_through_every_match_once(app, seed):
+    names = seed(app, users=1)
+    with app.app_context():
+        domain = app.extensions['domain']
+        # Several repeats rank some thoughts above others, many tie
+        assert domain.import_thoughts(
+            {"username": names[0], "content": " ".join(["apple"] * (1 + i % 3) + ["pie", str(i)])}
+            for i in range(45))[0]
+        assert domain.import_thoughts([{"username": names[0], "content": "banana"}])[0]
+        seen, cursor, pages = [], None, 0
+        while True:
+            s, page = domain.search_thoughts("apple", cursor=cursor, page_size=20)
+            assert s, page
+            pages += 1
+            seen += [row.id for row in page.items]
+            if page.next_cursor is None:
+                break
+            assert len(page.items) == 20
+            cursor = page.next_cursor
+        assert pages == 3
+        assert sorted(seen) == list(range(1, 46))
+        assert domain.search_thoughts("apple", cursor="nonsense") == (False, "Invalid cursor")
+        s, page = domain.search_thoughts("app*")
+        assert len(page.items) == 20 and page.next_cursor
+
+
+def test_index_follows_create_update_and_delete(app, seed):
+    names = seed(app, users=1)
+    with app.app_context():
+        domain = app.extensions['domain']
+        user = domain.get_principal(domain.db.session.query(User.id).filter_by(username=names[0]).scalar())
+
+        def found(query):
+            s, page = domain.search_thoughts(query)
+            assert s, page
+            return [row.id for row in page.items]
+
+        s, thought = domain.create_thought_userid("a quiet harbour", user)
+        assert s, thought
+        thought_id = thought.id
+        assert found("harbour") == [thought_id]
+
+        assert domain.update_thought(thought_id, "a busy market", user=user)[0]
+        assert found("harbour") == []
+        assert found("market") == [thought_id]
+
+        assert domain.delete_thought(thought_id, user)[0]
+        assert found("market") == []
@@ -0,0 +1,32 @@
+import os
+import threading
+
+import pytest
+
+from app import shared_secret_key
+
+
+def test_concurrent_workers_agree_on_one_key(tmp_path):
+    barrier = threading.Barrier(16)
+    keys = []
+
+    def start():
+        barrier.wait()
+        keys.append(shared_secret_key(str(tmp_path)))
+
+    threads = [threading.Thread(target=start) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(keys) == 16
+    assert len(set(keys)) == 1 and keys[0]
+    assert os.listdir(tmp_path) == ["secret_key"]
+    assert shared_secret_key(str(tmp_path)) == keys[0]
+
+
+def test_empty_key_file_is_refused(tmp_path):
+    (tmp_path / "secret_key").write_text("")
+    with pytest.raises(RuntimeError):
+        shared_secret_key(str(tmp_path))
@@ -0,0 +1,73 @@
+from datetime import datetime
+
+from sqlalchemy import event
+
+from model import User
+
+
+def seed_timeline(app, seed):
+    # user00 writes the odd thoughts, user01 the even ones, a day apart
+    names = seed(app, users=2)
+    with app.app_context():
+        domain = app.extensions['domain']
+        assert domain.import_thoughts(
+            {"id": t, "username": names[(t - 1) % 2], "content": f"thought {t}",
+             "created_at": datetime(2024, 1, t).isoformat()}
+            for t in range(1, 12))[0]
+        return domain.db.session.query(User.id).filter_by(username=names[0]).scalar()
+
+
+def test_timeline_pages_newest_first_until_the_end(app, seed):
+    user_id = seed_timeline(app, seed)
+    with app.app_context():
+        domain = app.extensions['domain']
+        pages, cursor = [], None
+        while True:
+            s, page = domain.get_user_timeline(user_id, before=cursor, page_size=2)
+            assert s, page
+            pages.append([row.id for row in page.items])
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+            assert cursor == page.items[-1].id
+        assert pages == [[11, 9], [7, 5], [3, 1]]
+
+        s, page = domain.get_user_timeline(user_id, since=datetime(2024, 1, 3),
+                                           until=datetime(2024, 1, 9), page_size=2)
+        assert [row.id for row in page.items] == [7, 5]
+        s, page = domain.get_user_timeline(user_id, before=page.next_cursor, since=datetime(2024, 1, 3),
+                                           until=datetime(2024, 1, 9), page_size=2)
+        assert [(row.id, row.created_at) for row in page.items] == [(3, datetime(2024, 1, 3))]
+        assert page.next_cursor is None
+
+
+def test_timeline_page_is_chosen_from_the_timeline_index(app, seed):
+    user_id = seed_timeline(app, seed)
+    statements = []
+    with app.app_context():
+        domain = app.extensions['domain']
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            statements.append((statement, parameters))
+
+        event.listen(domain.db.engine, "before_cursor_execute", capture)
+        try:
+            assert domain.get_user_timeline(user_id, before=9, since=datetime(2024, 1, 2))[0]
+        finally:
+            event.remove(domain.db.engine, "before_cursor_execute", capture)
+        (statement, parameters), = statements
+        plan = " | ".join(row[-1] for row in domain.db.session.connection().exec_driver_sql(
+            "EXPLAIN QUERY PLAN " + statement, parameters))
+    assert "COVERING INDEX ix_thoughts_user_timeline" in plan
+    assert "INTEGER PRIMARY KEY" in plan
+
+
+def test_timeline_api_follows_the_cursor(app, seed):
+    user_id = seed_timeline(app, seed)
+    client = app.test_client()
+    first = client.get(f"/api/v1/users/{user_id}/thoughts?size=4").get_json()
+    assert [item["id"] for item in first["items"]] == [11, 9, 7, 5]
+    assert first["items"][0]["created_at"] == "2024-01-11T00:00:00"
+    last = client.get(f"/api/v1/users/{user_id}/thoughts?size=4&before={first['next_cursor']}").get_json()
+    assert [item["id"] for item in last["items"]] == [3, 1]
+    assert last["next_cursor"] is None
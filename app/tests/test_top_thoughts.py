@@ -0,0 +1,64 @@
+import random
+
+from cedar.authz import SecurityException
+from model import User
+
+USERS = 6
+THOUGHTS = 12
+
+
+def test_top_thoughts_follow_votes_and_deletes(make_app, seed):
+    # No periodic rebuild: every step has to be applied to the ranking in place
+    app = make_app(LEADERBOARD_REFRESH=None)
+    names = seed(app, users=USERS, thoughts=THOUGHTS)
+    domain = app.extensions['domain']
+    rng = random.Random(24)
+
+    with app.app_context():
+        ids = {u.username: u.id for u in domain.db.session.query(User)}
+        users = [domain.get_principal(ids[name]) for name in names]
+        owner = {t: users[(t - 1) % USERS] for t in range(1, THOUGHTS + 1)}
+        s, _ = domain.top_thoughts()
+        assert s
+        built_at = domain._leaderboard.built_at
+
+        def check():
+            for n in (3, 100):
+                s, rows = domain.top_thoughts(n)
+                assert s, rows
+                assert [(row.id, row.votes) for row in rows] == \
+                    [tuple(row) for row in domain.rank_thoughts_sql(n)]
+
+        check()
+        for step in range(150):
+            user = rng.choice(users)
+            thought = rng.choice(list(owner))
+            kind = rng.random()
+            if kind < 0.4:
+                try:
+                    domain.create_vote_userid_thoughtid(user.id, thought)
+                except SecurityException:
+                    pass
+            elif kind < 0.6:
+                try:
+                    domain.create_vote_user(thought, user)
+                except SecurityException:
+                    pass
+            elif kind < 0.75:
+                domain.delete_vote(user.id, thought)
+            elif kind < 0.85:
+                domain.apply_batch(user, [{"op": "vote", "thought": rng.choice(list(owner))}
+                                          for _ in range(3)])
+            elif kind < 0.93:
+                creator = owner[thought]
+                s, rs = domain.delete_thought(thought, creator)
+                assert s, rs
+                del owner[thought]
+            else:
+                s, rs = domain.create_thought_userid(f"thought {step}", user)
+                assert s, rs
+                owner[rs.id] = user
+            check()
+
+        assert domain._leaderboard.built_at == built_at
+        assert len(owner) > 3
@@ -0,0 +1,41 @@
+import threading
+
+from vote_queue import VoteQueue
+
+
+def test_vote_committed_but_not_released_is_counted_once():
+    committed, writing, finish = {}, threading.Event(), threading.Event()
+
+    def write(batch):
+        for key in batch:
+            committed[key] = committed.get(key, 0) + 1
+        # Committed in the database, still pending in the queue
+        writing.set()
+        finish.wait(5)
+        return True, batch
+
+    queue = VoteQueue(write, interval=0.01)
+
+    def read():
+        # The database read never runs under the queue's lock
+        assert queue._cond.acquire(blocking=False)
+        queue._cond.release()
+        return committed.get((1, 1), 0)
+
+    try:
+        assert queue.submit(1, 1, read, limit=2) == (True, "")
+        assert writing.wait(5)
+        results = []
+        voter = threading.Thread(target=lambda: results.append(queue.submit(1, 1, read, limit=2)))
+        voter.start()
+        # It waits for the write to end rather than counting the vote twice
+        voter.join(0.1)
+        assert voter.is_alive()
+        finish.set()
+        voter.join(5)
+        assert results == [(True, "")]
+        assert queue.submit(1, 1, read, limit=2)[0] is False
+    finally:
+        finish.set()
+        queue.close()
+    assert committed == {(1, 1): 2}
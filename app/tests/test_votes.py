@@ -0,0 +1,57 @@
+import threading
+
+import pytest
+from sqlalchemy import func, select
+
+from cedar.authz import SecurityException
+from domain import VOTE_LIMIT
+from model import Thought, User, Vote
+
+THREADS = 16
+
+
+@pytest.mark.parametrize("mode", ["direct", "user", "queue"])
+def test_concurrent_votes_stop_at_the_limit(make_app, seed, mode):
+    app = make_app(VOTE_QUEUE_ENABLED=mode == "queue")
+    domain = app.extensions['domain']
+    # Thought 1 belongs to user00, user01 votes on it
+    seed(app, users=2, thoughts=1)
+    with app.app_context():
+        voter = domain.get_principal(domain.db.session.scalar(
+            select(User.id).where(User.username == "user01")))
+
+    barrier = threading.Barrier(THREADS)
+    accepted, errors = [], []
+
+    def vote():
+        with app.app_context():
+            barrier.wait()
+            try:
+                if mode == "direct":
+                    s, _ = domain.create_vote_userid_thoughtid(voter.id, 1)
+                else:
+                    s, _ = domain.create_vote_user(1, voter)
+            except SecurityException:
+                s = False
+            except Exception as e:
+                errors.append(e)
+                return
+            if s:
+                accepted.append(1)
+
+    threads = [threading.Thread(target=vote) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if mode == "queue":
+        domain.vote_queue.close()
+
+    assert errors == []
+    assert len(accepted) == VOTE_LIMIT
+    with app.app_context():
+        session = domain.db.session
+        assert session.scalar(select(func.count(Vote.id))
+                              .where(Vote.person == voter.id, Vote.thought == 1)) == VOTE_LIMIT
+        assert domain.get_user_vote_count(voter.id, 1) == VOTE_LIMIT
+        assert session.scalar(select(Thought.vote_count).where(Thought.id == 1)) == VOTE_LIMIT
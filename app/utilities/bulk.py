@@ -0,0 +1,77 @@
+import csv
+import json
+from datetime import datetime, timezone
+from itertools import islice
+from typing import IO, Any, Iterable, Iterator
+
+FORMATS = ("jsonl", "csv")
+# CSV has no lists: list fields, such as a user's roles, are joined with this
+LIST_SEPARATOR = ";"
+
+
+def detect_format(filename: str, fmt: str | None = None) -> str:
+    """Explicit format, else the file extension, else JSONL (e.g. for stdin)"""
+    if fmt:
+        return fmt
+    if filename.lower().endswith(".csv"):
+        return "csv"
+    return "jsonl"
+
+
+def read_records(stream: IO[str], fmt: str) -> Iterator[dict[str, Any]]:
+    """Lazily parse one record per line (JSONL) or per row (CSV, with a header)"""
+    if fmt == "csv":
+        for row in csv.DictReader(stream):
+            yield {key: value for key, value in row.items() if value != ""}
+        return
+    for number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            raise ValueError(f"line {number}: {e}") from e
+
+
+def write_records(stream: IO[str], fmt: str, fields: list[str], records: Iterable[dict[str, Any]]) -> int:
+    """Write records as they come, returning how many were written"""
+    count = 0
+    if fmt == "csv":
+        writer = csv.DictWriter(stream, fieldnames=fields)
+        writer.writeheader()
+        for record in records:
+            writer.writerow({key: LIST_SEPARATOR.join(value) if isinstance(value, list) else value
+                             for key, value in record.items()})
+            count += 1
+        return count
+    for record in records:
+        stream.write(json.dumps(record, ensure_ascii=False))
+        stream.write("\n")
+        count += 1
+    return count
+
+
+def as_list(value: Any) -> list[str]:
+    """A list field read from either format"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        return [item for item in value.split(LIST_SEPARATOR) if item]
+    return list(value)
+
+
+def as_datetime(value: Any) -> datetime | None:
+    """An ISO 8601 time read from either format, as naive UTC; ValueError when unreadable"""
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(str(value))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def chunked(records: Iterable[Any], size: int) -> Iterator[list[Any]]:
+    iterator = iter(records)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
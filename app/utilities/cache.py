@@ -0,0 +1,163 @@
+import pickle
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from typing import Any, Iterable
+
+try:
+    import redis
+except ImportError:  # optional dependency, only needed for the redis backend
+    redis = None
+
+
+class MemoryBackend:
+    """
+    In-process LRU store with per-entry expiry. Counters are kept in an LRU of
+    their own, `counter_maxsize` long (8 per entry by default): their values
+    come from one clock, and a counter read after being evicted starts again
+    from the highest value evicted, so it never repeats a version it had.
+    """
+
+    def __init__(self, maxsize: int = 512, counter_maxsize: int | None = None):
+        self.maxsize = maxsize
+        self.counter_maxsize = counter_maxsize or 8 * maxsize
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._counters: OrderedDict[str, int] = OrderedDict()
+        self._clock = 0
+        self._floor = 0
+        self._lock = Lock()
+
+    def get(self, key: str) -> Any | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, value: Any, ttl: float):
+        with self._lock:
+            self._entries[key] = (monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def counters(self, keys: list[str]) -> list[int]:
+        with self._lock:
+            values = []
+            for key in keys:
+                value = self._counters.get(key)
+                if value is None:
+                    value = self._counters[key] = self._floor
+                else:
+                    self._counters.move_to_end(key)
+                values.append(value)
+            self._evict_counters()
+            return values
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            self._clock += 1
+            self._counters[key] = self._clock
+            self._counters.move_to_end(key)
+            self._evict_counters()
+            return self._clock
+
+    def _evict_counters(self):
+        while len(self._counters) > self.counter_maxsize:
+            _, value = self._counters.popitem(last=False)
+            self._floor = max(self._floor, value)
+
+
+class RedisBackend:
+    """Store shared by every worker through a Redis-compatible server"""
+
+    def __init__(self, url: str, prefix: str = "thoughts:"):
+        if redis is None:
+            raise RuntimeError("The redis cache backend requires the 'redis' package")
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key: str) -> Any | None:
+        raw = self.client.get(self.prefix + key)
+        return pickle.loads(raw) if raw is not None else None
+
+    def set(self, key: str, value: Any, ttl: float):
+        self.client.set(self.prefix + key, pickle.dumps(value), px=int(ttl * 1000))
+
+    def counters(self, keys: list[str]) -> list[int]:
+        if not keys:
+            return []
+        return [int(v or 0) for v in self.client.mget([self.prefix + k for k in keys])]
+
+    def incr(self, key: str) -> int:
+        return self.client.incr(self.prefix + key)
+
+
+class TaggedCache:
+    """
+    Read-through cache whose entries are tagged, e.g. with the thoughts they show.
+    Invalidating a tag bumps its version counter, and an entry is only served
+    while every tag still has the version it was stored with, so invalidation
+    is precise and also works across processes with a shared backend.
+    """
+
+    WRITES = "writes"
+
+    def __init__(self, backend, ttl: float = 30.0):
+        self.backend = backend
+        self.ttl = ttl
+
+    def get(self, key: str) -> tuple[Any, dict[str, int]] | None:
+        """The cached value and the tag versions it is valid for"""
+        entry = self.backend.get(key)
+        if entry is None:
+            return None
+        value, versions = entry
+        tags = list(versions)
+        if self.backend.counters(["tag:" + t for t in tags]) != [versions[t] for t in tags]:
+            return None
+        return value, versions
+
+    def write_marker(self) -> int:
+        """Snapshot taken before computing a value, see `set`"""
+        return self.backend.counters([self.WRITES])[0]
+
+    def set(self, key: str, value: Any, tags: Iterable[str], marker: int) -> dict[str, int] | None:
+        """
+        Store `value` unless a write happened since `marker` was taken: the value
+        may predate that write while its tags would already carry the new versions.
+        Returns the tag versions stored, None when the value was not cached.
+        """
+        tags = list(tags)
+        counters = self.backend.counters([self.WRITES] + ["tag:" + t for t in tags])
+        if counters[0] != marker:
+            return None
+        versions = dict(zip(tags, counters[1:]))
+        self.backend.set(key, (value, versions), self.ttl)
+        return versions
+
+    def set_derived(self, key: str, value: Any, versions: dict[str, int]):
+        """Store a value computed from another entry, valid as long as that entry is"""
+        self.backend.set(key, (value, versions), self.ttl)
+
+    def invalidate(self, *tags: str):
+        for tag in tags:
+            self.backend.incr("tag:" + tag)
+        self.backend.incr(self.WRITES)
+
+
+def create_cache(config, size: int | None = None, ttl: float | None = None) -> TaggedCache:
+    """
+    Build the cache selected by FEED_CACHE_BACKEND ("memory" or "redis").
+    `size` and `ttl` override FEED_CACHE_SIZE and FEED_CACHE_TTL, for caches
+    of other data sharing the same backend choice.
+    """
+    if config.get('FEED_CACHE_BACKEND', 'memory') == 'redis':
+        backend = RedisBackend(config['FEED_CACHE_URL'])
+    else:
+        backend = MemoryBackend(maxsize=size or config.get('FEED_CACHE_SIZE', 512))
+    return TaggedCache(backend, ttl=ttl or config.get('FEED_CACHE_TTL', 30.0))
@@ -0,0 +1,110 @@
+from bisect import bisect_left, insort
+from threading import Lock
+from time import monotonic
+from typing import Iterable
+
+
+class Leaderboard:
+    """
+    Items ranked by score, highest first, ties broken by the lower id.
+
+    Keys are kept in a segmented sorted list: short sorted runs of at most
+    2 * LOAD keys plus the maximum of each run. Finding a key is two
+    binary searches, O(log n). Moving it only shifts one run, so a score
+    change never copies the whole ranking the way a single big list would.
+    """
+
+    LOAD = 500
+
+    def __init__(self):
+        self._runs: list[list[tuple[int, int]]] = []
+        self._maxes: list[tuple[int, int]] = []
+        self._scores: dict[int, int] = {}
+        self._lock = Lock()
+        self.built_at: float | None = None
+
+    def __len__(self):
+        return len(self._scores)
+
+    def __contains__(self, item_id):
+        return item_id in self._scores
+
+    def rebuild(self, scores: Iterable[tuple[int, int]]):
+        """Replace the whole ranking with (id, score) pairs"""
+        scores = dict(scores)
+        keys = sorted((-score, item_id) for item_id, score in scores.items())
+        runs = [keys[i:i + self.LOAD] for i in range(0, len(keys), self.LOAD)]
+        with self._lock:
+            self._scores = scores
+            self._runs = runs
+            self._maxes = [run[-1] for run in runs]
+            self.built_at = monotonic()
+
+    def invalidate(self):
+        """Mark the ranking as out of date until the next rebuild"""
+        self.built_at = None
+
+    def set(self, item_id: int, score: int):
+        with self._lock:
+            old = self._scores.get(item_id)
+            if old is not None:
+                self._remove((-old, item_id))
+            self._scores[item_id] = score
+            self._insert((-score, item_id))
+
+    def add(self, item_id: int, delta: int) -> bool:
+        """Change the score of a ranked item, False when it is not ranked"""
+        with self._lock:
+            old = self._scores.get(item_id)
+            if old is None:
+                return False
+            self._remove((-old, item_id))
+            self._scores[item_id] = old + delta
+            self._insert((-(old + delta), item_id))
+            return True
+
+    def discard(self, item_id: int):
+        with self._lock:
+            old = self._scores.pop(item_id, None)
+            if old is not None:
+                self._remove((-old, item_id))
+
+    def top(self, n: int) -> list[tuple[int, int]]:
+        """The first `n` (id, score) pairs"""
+        result = []
+        with self._lock:
+            for run in self._runs:
+                for negative_score, item_id in run[:n - len(result)]:
+                    result.append((item_id, -negative_score))
+                if len(result) >= n:
+                    break
+        return result
+
+    def _insert(self, key):
+        if not self._runs:
+            self._runs.append([key])
+            self._maxes.append(key)
+            return
+        i = bisect_left(self._maxes, key)
+        if i == len(self._maxes):
+            i -= 1
+            self._runs[i].append(key)
+            self._maxes[i] = key
+        else:
+            insort(self._runs[i], key)
+        run = self._runs[i]
+        if len(run) > 2 * self.LOAD:
+            self._runs.insert(i + 1, run[self.LOAD:])
+            self._maxes.insert(i + 1, run[-1])
+            del run[self.LOAD:]
+            self._maxes[i] = run[-1]
+
+    def _remove(self, key):
+        i = bisect_left(self._maxes, key)
+        run = self._runs[i]
+        del run[bisect_left(run, key)]
+        if run:
+            self._maxes[i] = run[-1]
+        else:
+            del self._runs[i]
+            del self._maxes[i]
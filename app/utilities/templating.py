@@ -0,0 +1,57 @@
+import os
+
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+
+class FragmentCacheExtension(Extension):
+    """
+    `{% cache "name", key... tags expr %}...{% endcache %}` keeps the rendered
+    body in `environment.fragment_cache`, a TaggedCache. The key parts must
+    cover everything the body shows; `tags` (a string or a list) names what
+    invalidates it besides a changed key.
+    """
+
+    tags = {"cache"}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        parts = [parser.parse_expression()]
+        while parser.stream.skip_if("comma"):
+            parts.append(parser.parse_expression())
+        tags = parser.parse_expression() if parser.stream.skip_if("name:tags") else nodes.List([])
+        body = parser.parse_statements(("name:endcache",), drop_needle=True)
+        call = self.call_method("_render", [nodes.List(parts), tags])
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _render(self, parts, tags, caller):
+        cache = self.environment.fragment_cache
+        if cache is None:
+            return caller()
+        key = "fragment:" + ":".join(str(part) for part in parts)
+        cached = cache.get(key)
+        if cached is not None:
+            return Markup(cached[0])
+        marker = cache.write_marker()
+        html = caller()
+        cache.set(key, str(html), [tags] if isinstance(tags, str) else tags, marker)
+        return html
+
+
+def init_templates(app, fragment_cache=None):
+    """
+    Compiled templates go to JINJA_BYTECODE_CACHE_DIR (the instance folder by
+    default) so restarted workers skip compiling them; `{% cache %}` fragments
+    go to `fragment_cache`.
+    """
+    if app.config.get('JINJA_BYTECODE_CACHE', True):
+        directory = app.config.get('JINJA_BYTECODE_CACHE_DIR') or os.path.join(app.instance_path, 'jinja-cache')
+        os.makedirs(directory, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    app.jinja_env.fragment_cache = fragment_cache
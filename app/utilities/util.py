@@ -1,6 +1,6 @@
 from typing import Any, Optional, Generic, TypeVar
-from app import session
-from jsonschema import validate, ValidationError
+from flask import session
+from jsonschema import Draft202012Validator, ValidationError
 
 def is_client_authn(**kwargs: dict) -> bool :
     return 'username' in session
@@ -23,20 +23,78 @@ USER_SCHEMA = {
     "additionalProperties": False
 }
 
-def validate_user_data(data: dict, schema : Optional[dict]) -> tuple[bool, str]:
-    """
-    Validate user data against JSON schema.
+# JSON API request bodies
+THOUGHT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "content": {
+            "type": "string",
+            "minLength": 1,
+            "maxLength": 500
+        }
+    },
+    "required": ["content"],
+    "additionalProperties": False
+}
 
-    Args:
-        data: Dictionary containing username and password
+BATCH_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "operations": {
+            "type": "array",
+            "minItems": 1,
+            "maxItems": 500,
+            "items": {
+                "type": "object",
+                "properties": {
+                    "op": {"enum": ["vote", "delete"]},
+                    "thought": {"type": "integer", "minimum": 1}
+                },
+                "required": ["op", "thought"],
+                "additionalProperties": False
+            }
+        }
+    },
+    "required": ["operations"],
+    "additionalProperties": False
+}
+
+# `jsonschema.validate` checks the schema itself on every call: keep one
+# checked validator per schema instead
+_validators: dict[int, Draft202012Validator] = {}
+
+def schema_validator(schema: dict) -> Draft202012Validator:
+    validator = _validators.get(id(schema))
+    if validator is None:
+        Draft202012Validator.check_schema(schema)
+        validator = _validators[id(schema)] = Draft202012Validator(schema)
+    return validator
+
+def validate_data(data: Any, schema: dict) -> tuple[bool, str]:
+    """
+    Validate data against a JSON schema.
 
     Returns:
         Tuple of (is_valid, error_message)
     """
     try:
-        validate(instance=data, schema=USER_SCHEMA)
+        schema_validator(schema).validate(data)
         return True, ""
     except ValidationError as e:
-        return False, str(e.message)
+        path = "/".join(str(part) for part in e.absolute_path)
+        return False, f"{path}: {e.message}" if path else str(e.message)
     except Exception as e:
         return False, f"Validation error: {str(e)}"
+
+def validate_user_data(data: dict, schema : Optional[dict] = None) -> tuple[bool, str]:
+    """
+    Validate user data against JSON schema.
+
+    Args:
+        data: Dictionary containing username and password
+        schema: Schema to use instead of USER_SCHEMA
+
+    Returns:
+        Tuple of (is_valid, error_message)
+    """
+    return validate_data(data, schema or USER_SCHEMA)
@@ -0,0 +1,131 @@
+import logging
+from queue import Empty, Full, Queue
+from threading import Condition, Event, Thread
+from time import monotonic
+
+logger = logging.getLogger(__name__)
+
+
+class VoteQueue:
+    """
+    Background writer for votes. Request threads reserve a vote against the
+    per-user limit in memory and enqueue it; one thread commits the queue in
+    micro-batches, so bursts of votes share a single SQLite write transaction.
+
+    The in-memory reservation only sees this process: `write` must enforce the
+    limit again in the database and return the votes it actually stored.
+    """
+
+    LIMIT_REACHED = "You have reached the maximum number of votes for this thought"
+
+    def __init__(self, write, maxsize: int = 10000, batch_size: int = 500,
+                 interval: float = 0.05, put_timeout: float = 0.5):
+        self.write = write
+        self.batch_size = batch_size
+        self.interval = interval
+        self.put_timeout = put_timeout
+        self.dropped = 0
+        self.rejected = 0
+        self._queue: Queue = Queue(maxsize=maxsize)
+        # (person, thought) -> votes queued or being written
+        self._pending: dict[tuple[int, int], int] = {}
+        # Keys of the batch being written, and how many batches were written
+        self._writing: set[tuple[int, int]] = set()
+        self._written = 0
+        self._cond = Condition()
+        self._closed = Event()
+        self._thread = Thread(target=self._run, name="vote-writer", daemon=True)
+        self._thread.start()
+
+    def count(self, person: int, thought: int, committed) -> int:
+        """The user's votes on the thought: `committed()` plus those still queued"""
+        key = (person, thought)
+        while True:
+            written = self._settled(key)
+            total = committed()
+            with self._cond:
+                if key not in self._writing and self._written == written:
+                    return total + self._pending.get(key, 0)
+
+    def submit(self, person: int, thought: int, committed, limit: int) -> tuple[bool, str]:
+        """
+        Reserve and enqueue one vote. `committed()` reads the user's vote count
+        on the thought from the database, outside the lock. A batch committed
+        during that read may or may not be in it while its votes are still
+        pending, so the read is retried then: no vote is counted twice or not
+        at all.
+        """
+        if self._closed.is_set():
+            return False, "The server is shutting down, try again"
+        key = (person, thought)
+        while True:
+            written = self._settled(key)
+            total = committed()
+            with self._cond:
+                if key in self._writing or self._written != written:
+                    continue
+                if total + self._pending.get(key, 0) >= limit:
+                    return False, self.LIMIT_REACHED
+                self._pending[key] = self._pending.get(key, 0) + 1
+                break
+        try:
+            # Backpressure: wait a little for the writer, then give up
+            self._queue.put(key, timeout=self.put_timeout)
+        except Full:
+            with self._cond:
+                self._release([key])
+            return False, "Too many votes right now, try again"
+        return True, ""
+
+    def close(self, timeout: float = 5.0):
+        """Stop taking votes and commit everything already queued"""
+        self._closed.set()
+        self._thread.join(timeout)
+
+    def _settled(self, key) -> int:
+        """Wait until no batch holding `key` is being written, then the batch count"""
+        with self._cond:
+            while key in self._writing:
+                self._cond.wait()
+            return self._written
+
+    def _release(self, keys):
+        for key in keys:
+            left = self._pending[key] - 1
+            if left:
+                self._pending[key] = left
+            else:
+                del self._pending[key]
+
+    def _run(self):
+        while not (self._closed.is_set() and self._queue.empty()):
+            try:
+                batch = [self._queue.get(timeout=self.interval)]
+            except Empty:
+                continue
+            deadline = monotonic() + self.interval
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=max(deadline - monotonic(), 0)))
+                except Empty:
+                    break
+            with self._cond:
+                self._writing = set(batch)
+            try:
+                s, stored = self.write(batch)
+                if not s:
+                    self.dropped += len(batch)
+                    logger.error("Dropped %d queued votes: %s", len(batch), stored)
+                elif len(stored) < len(batch):
+                    self.rejected += len(batch) - len(stored)
+                    logger.warning("%d queued votes exceeded the vote limit", len(batch) - len(stored))
+            except Exception:
+                self.dropped += len(batch)
+                logger.exception("Dropped %d queued votes", len(batch))
+            finally:
+                # The stored votes leave pending in the same step that ends the write
+                with self._cond:
+                    self._release(batch)
+                    self._writing = set()
+                    self._written += 1
+                    self._cond.notify_all()